@@ -0,0 +1,170 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import purge
+
+STATS_PREFIX = 'cache-stats'
+VERSION_PREFIX = 'version'
+LOCK_PREFIX = 'lock'
+STALE_PREFIX = 'stale'
+
+# Значение fetch: сколько секунд его считали и когда оно истекает.
+Entry = namedtuple('Entry', 'value delta expires')
+
+# Счетчики событий этого процесса, еще не перенесенные в общий кэш.
+_pending = Counter()
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _initial_version():
+    # Версия, начатая заново после вытеснения ключа, не должна совпасть
+    # со старой, иначе всплывут устаревшие фрагменты.
+    return int(time.time() * 1000)
+
+
+def get_versions(*names):
+    """Текущие версии пространств имен одним get_many."""
+    keys = {f'{VERSION_PREFIX}:{name}': name for name in names}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, name in keys.items():
+        if key not in found:
+            cache.add(key, _initial_version(), None)
+            found[key] = cache.get(key)
+        versions[name] = found[key]
+    return versions
+
+
+def bump(*names):
+    """Инвалидирует все ключи, построенные на версиях names.
+
+    Те же имена служат суррогатными ключами страниц у прокси.
+    """
+    purge.schedule(*names)
+    for name in set(names):
+        key = f'{VERSION_PREFIX}:{name}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), None)
+
+
+def _digest(data):
+    return hashlib.md5(repr(data).encode()).hexdigest()
+
+
+def versioned_key(prefix, names, *parts):
+    """Ключ, который меняется при bump любого из names."""
+    versions = get_versions(*names)
+    return f'{prefix}:{_digest((sorted(versions.items()), parts))}'
+
+
+def stale_key(prefix, names, *parts):
+    """Ключ последнего значения versioned_key при любых версиях.
+
+    Имена лент входят в ключ, версии — нет: у каждой ленты свой запасной
+    слот, и страница группы не получит копию соседней группы.
+    """
+    return f'{STALE_PREFIX}:{prefix}:{_digest((sorted(names), parts))}'
+
+
+def lock(key):
+    """Короткая блокировка пересчета key, общая для всех воркеров."""
+    return cache.add(f'{LOCK_PREFIX}:{key}', 1, settings.CACHE_LOCK_TIMEOUT)
+
+
+def unlock(key):
+    cache.delete(f'{LOCK_PREFIX}:{key}')
+
+
+def _expires_early(entry):
+    """Вероятностный досрочный пересчет (XFetch).
+
+    Чем ближе срок и чем дольше значение считалось, тем вероятнее
+    пересчет: воркеры обновляют ключ по одному, не дожидаясь промаха.
+    """
+    early = (entry.delta * settings.CACHE_EARLY_BETA
+             * -math.log(1 - random.random()))
+    return time.time() + early >= entry.expires
+
+
+def fetch(key, build, timeout, stale=None):
+    """Значение key из кэша; при промахе build() считает один воркер.
+
+    Пока значение пересчитывается, остальные воркеры отдают старую копию:
+    истекающую запись key или последнее значение под ключом stale. Без
+    старой копии считают сами — ждать некого. Пересчеты, досрочные
+    пересчеты и отданные старые копии видны в cache_stats.
+    """
+    found = cache.get_many([key, stale] if stale else [key])
+    entry = found.get(key)
+    # Значение в старом формате, без Entry, считается промахом.
+    if isinstance(entry, Entry):
+        if not _expires_early(entry):
+            return entry.value
+        record('cache.early')
+    else:
+        entry = found.get(stale)
+    locked = lock(key)
+    if not locked and isinstance(entry, Entry):
+        record('cache.stale')
+        return entry.value
+    try:
+        record('cache.recompute')
+        started = time.monotonic()
+        value = build()
+        entry = Entry(value, time.monotonic() - started,
+                      time.time() + timeout)
+        cache.set_many(dict.fromkeys([key, stale] if stale else [key],
+                                     entry), timeout)
+    finally:
+        if locked:
+            unlock(key)
+    return value
+
+
+def record(event):
+    """Увеличивает счетчик события для мониторинга.
+
+    Счетчик копится в памяти процесса и уходит в общий кэш раз в
+    CACHE_STATS_INTERVAL секунд: запись на каждое попадание брала бы
+    блокировку записи SQLiteCache у всех воркеров даже на чтении.
+    """
+    with _pending_lock:
+        _pending[event] += 1
+        due = (time.monotonic() - _flushed_at
+               >= settings.CACHE_STATS_INTERVAL)
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    """Переносит накопленные счетчики процесса в общий кэш."""
+    global _flushed_at
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    for event, count in pending.items():
+        key = f'{STATS_PREFIX}:{event}'
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, None):
+                cache.incr(key, count)
+
+
+def stats(*events):
+    """Значения счетчиков событий, включая еще не перенесенные."""
+    flush_stats()
+    values = cache.get_many([f'{STATS_PREFIX}:{event}' for event in events])
+    return {event: values.get(f'{STATS_PREFIX}:{event}', 0)
+            for event in events}
@@ -0,0 +1,439 @@
+"""Общие для всех процессов бэкенды кэша.
+
+RedisCache говорит на протоколе Redis (RESP) без внешних зависимостей,
+SQLiteCache хранит кэш в файле SQLite и подходит, когда Redis нет.
+Оба сжимают крупные значения и хранят целые числа как есть, чтобы
+incr был атомарным на стороне хранилища.
+"""
+import pickle
+import random
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+PICKLED = b'P'
+COMPRESSED = b'Z'
+CULL_PROBABILITY = 0.01
+
+# incr без гонки между проверкой ключа и INCRBY: скрипт атомарен в Redis.
+INCR_SCRIPT = ("if redis.call('EXISTS', KEYS[1]) == 1 then "
+               "return redis.call('INCRBY', KEYS[1], ARGV[1]) end "
+               "return false")
+
+
+class SerializerMixin:
+    """Pickle для объектов, zlib для больших значений, int как текст."""
+
+    def _init_serializer(self, options):
+        self._compress_min_length = options.get('COMPRESS_MIN_LENGTH', 1024)
+        self._compress_level = options.get('COMPRESS_LEVEL', 6)
+
+    def _dumps(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return str(value).encode()
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) >= self._compress_min_length:
+            return COMPRESSED + zlib.compress(data, self._compress_level)
+        return PICKLED + data
+
+    def _loads(self, data):
+        if isinstance(data, int):
+            return data
+        data = bytes(data)
+        if data[:1] == COMPRESSED:
+            return pickle.loads(zlib.decompress(data[1:]))
+        if data[:1] == PICKLED:
+            return pickle.loads(data[1:])
+        return int(data)
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """Минимальный клиент RESP: команды и конвейер."""
+
+    def __init__(self, host, port, db, timeout):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.reader = self.sock.makefile('rb')
+        if db:
+            self.execute('SELECT', db)
+
+    @staticmethod
+    def _pack(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Redis закрыл соединение.')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            return RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length == -1:
+                return None
+            return [self._read() for _ in range(length)]
+        raise RedisError(f'Неизвестный ответ: {line!r}')
+
+    def pipeline(self, *commands):
+        self.sock.sendall(b''.join(self._pack(args) for args in commands))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def execute(self, *args):
+        return self.pipeline(args)[0]
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisCache(SerializerMixin, BaseCache):
+    """Кэш в Redis: LOCATION вида redis://host:port/db."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._init_serializer(options)
+        url = urlparse(location if '://' in location
+                       else f'redis://{location}')
+        self._host = url.hostname or 'localhost'
+        self._port = url.port or 6379
+        self._db = int(url.path.lstrip('/') or 0)
+        self._socket_timeout = options.get('SOCKET_TIMEOUT', 5)
+        self._local = threading.local()
+
+    @property
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = RedisConnection(self._host, self._port, self._db,
+                                     self._socket_timeout)
+            self._local.client = client
+        return client
+
+    def _disconnect(self):
+        client = getattr(self._local, 'client', None)
+        self._local.client = None
+        if client is not None:
+            try:
+                client.close()
+            except OSError:
+                pass
+
+    def _execute(self, *commands, retry=True):
+        """Выполняет команды конвейером.
+
+        Устаревшее соединение заменяется новым, и команды повторяются,
+        только если retry: INCRBY или SET NX могли уже выполниться.
+        """
+        try:
+            return self._client.pipeline(*commands)
+        except (ConnectionError, OSError):
+            self._disconnect()
+            if not retry:
+                raise
+            return self._client.pipeline(*commands)
+
+    def _milliseconds(self, timeout):
+        """Время жизни в мс, None — бессрочно, 0 — уже истек."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return None
+        return max(int(timeout * 1000), 0)
+
+    def _set_command(self, key, value, ttl, *flags):
+        command = ['SET', key, self._dumps(value), *flags]
+        if ttl is not None:
+            command += ['PX', ttl]
+        return command
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        ttl = self._milliseconds(timeout)
+        if ttl == 0:
+            return False
+        return self._execute(self._set_command(key, value, ttl, 'NX'),
+                             retry=False)[0] == 'OK'
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        data = self._execute(['GET', key])[0]
+        return default if data is None else self._loads(data)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        ttl = self._milliseconds(timeout)
+        if ttl is None:
+            exists, _ = self._execute(['EXISTS', key], ['PERSIST', key])
+            return bool(exists)
+        if ttl == 0:
+            return bool(self._execute(['DEL', key])[0])
+        return bool(self._execute(['PEXPIRE', key, ttl])[0])
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._execute(['DEL', key])
+
+    def get_many(self, keys, version=None):
+        if not keys:
+            return {}
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        values = self._execute(['MGET', *made])[0]
+        return {made[key]: self._loads(value)
+                for key, value in zip(made, values) if value is not None}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if not data:
+            return []
+        ttl = self._milliseconds(timeout)
+        commands = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            if ttl == 0:
+                commands.append(['DEL', key])
+            else:
+                commands.append(self._set_command(key, value, ttl))
+        self._execute(*commands)
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        if keys:
+            self._execute(['DEL', *keys])
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self._execute(['EXISTS', key])[0])
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        try:
+            value = self._execute(['EVAL', INCR_SCRIPT, 1, key, delta],
+                                  retry=False)[0]
+        except RedisError as error:
+            raise ValueError(str(error))
+        if value is None:
+            raise ValueError(f"Key '{key}' not found")
+        return value
+
+    def clear(self):
+        """Удаляет только ключи своего KEY_PREFIX."""
+        if not self.key_prefix:
+            self._execute(['FLUSHDB'])
+            return
+        cursor = b'0'
+        while True:
+            cursor, keys = self._execute(
+                ['SCAN', cursor, 'MATCH', f'{self.key_prefix}:*',
+                 'COUNT', 1000])[0]
+            if keys:
+                self._execute(['DEL', *keys])
+            if cursor in (b'0', '0'):
+                return
+
+    def close(self, **kwargs):
+        # Django зовет close после каждого запроса; соединение с Redis
+        # живет в потоке и переиспользуется, как пул в redis-py.
+        pass
+
+
+class SQLiteCache(SerializerMixin, BaseCache):
+    """Кэш в файле SQLite, общий для всех процессов одной машины."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._init_serializer(params.get('OPTIONS', {}))
+        self._path = location
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=30,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _encode(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        return self._dumps(value)
+
+    def _cull(self):
+        """Удаляет истекшие ключи, а сверх MAX_ENTRIES — ближайшие к сроку.
+
+        Как в бэкендах Django, лишнее срезается на 1/CULL_FREQUENCY
+        (0 — все). COUNT дорог на каждый set, поэтому проверка идет
+        с вероятностью CULL_PROBABILITY: размер превышает MAX_ENTRIES
+        не больше чем на сотню-другую записей.
+        """
+        if random.random() >= CULL_PROBABILITY:
+            return
+        connection = self._connection
+        connection.execute(
+            'DELETE FROM cache WHERE expires < ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        # Бессрочные ключи (версии лент) удаляются последними.
+        connection.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+            'ORDER BY expires IS NULL, expires LIMIT ?)',
+            (max(count - self._max_entries,
+                 count // self._cull_frequency),))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self._connection.execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires WHERE cache.expires < ?',
+            (key, self._encode(value), self.get_backend_timeout(timeout),
+             time.time()))
+        return cursor.rowcount > 0
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self._connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires >= ?)',
+            (self.get_backend_timeout(timeout), key, time.time()))
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        if not made:
+            return {}
+        for key in made:
+            self.validate_key(key)
+        rows = self._connection.execute(
+            'SELECT key, value FROM cache WHERE key IN (%s) '
+            'AND (expires IS NULL OR expires >= ?)'
+            % ', '.join('?' * len(made)), (*made, time.time()))
+        return {made[key]: self._loads(value) for key, value in rows}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, self._encode(value), expires))
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)', rows)
+        self._cull()
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        if keys:
+            self._connection.execute(
+                'DELETE FROM cache WHERE key IN (%s)'
+                % ', '.join('?' * len(keys)), keys)
+
+    def has_key(self, key, version=None):
+        return bool(self.get_many([key], version=version))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE cache SET value = value + ? WHERE key = ? "
+                "AND typeof(value) = 'integer' "
+                "AND (expires IS NULL OR expires >= ?)",
+                (delta, key, time.time()))
+            if not cursor.rowcount:
+                raise ValueError(f"Key '{key}' not found")
+            return connection.execute(
+                'SELECT value FROM cache WHERE key = ?', (key,)).fetchone()[0]
+
+    def clear(self):
+        """Удаляет только ключи своего KEY_PREFIX."""
+        if not self.key_prefix:
+            self._connection.execute('DELETE FROM cache')
+            return
+        self._connection.execute(
+            "DELETE FROM cache WHERE substr(key, 1, ?) = ?",
+            (len(self.key_prefix) + 1, f'{self.key_prefix}:'))
+
+    def close(self, **kwargs):
+        # Соединения живут в потоках; Django зовет close после каждого
+        # запроса, а переподключение к SQLite дороже самого запроса.
+        pass
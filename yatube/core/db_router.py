@@ -0,0 +1,84 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# Состояние текущего запроса: читать ли из основной базы и была ли запись.
+_state = threading.local()
+# Реплики, которые не ответили, и время, до которого их не трогаем.
+_down = {}
+_lock = threading.Lock()
+
+
+def reset(pinned=False):
+    _state.pinned = pinned
+    _state.wrote = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+@contextmanager
+def use_primary():
+    """Все чтения внутри блока идут в основную базу."""
+    previous = is_pinned()
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = previous
+
+
+def mark_down(alias):
+    with _lock:
+        _down[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+
+def is_healthy(alias):
+    """Реплика отвечает; упавшую не трогаем REPLICA_RETRY_SECONDS секунд."""
+    with _lock:
+        if _down.get(alias, 0) > time.monotonic():
+            return False
+        _down.pop(alias, None)
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        mark_down(alias)
+        return False
+    return True
+
+
+class ReplicaRouter:
+    """Чтение — с реплик из DATABASE_REPLICAS, запись — в основную базу.
+
+    После первой записи запрос дочитывает из основной базы, чтобы не
+    наткнуться на отставание реплики.
+    """
+
+    def db_for_read(self, model, **hints):
+        if is_pinned():
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.DATABASE_REPLICAS
+                    if is_healthy(alias)]
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.pinned = True
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import stats
+
+EVENTS = ('fragment.hit', 'fragment.miss', 'page.hit', 'page.miss',
+          'cache.recompute', 'cache.early', 'cache.stale')
+
+
+class Command(BaseCommand):
+    help = ('Показывает счетчики попаданий и промахов кэша. Воркеры '
+            'переносят их в кэш раз в CACHE_STATS_INTERVAL секунд.')
+
+    def handle(self, *args, **options):
+        for event, value in stats(*EVENTS).items():
+            self.stdout.write(f'{event}: {value}')
@@ -0,0 +1,104 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = ('CREATE TABLE comment (id INTEGER PRIMARY KEY, post_id INTEGER, '
+          'text TEXT, created REAL)')
+INDEX = 'CREATE INDEX comment_post ON comment (post_id, created)'
+
+
+def run(path, pragmas, writers, readers, duration):
+    """Писатели и читатели в потоках на одной базе; счетчики операций.
+
+    Каждая запись — короткая транзакция «прочитать, затем вставить», как
+    у add_comment; именно она получает «database is locked».
+    """
+    counts = {'writes': 0, 'reads': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def connect():
+        conn = sqlite3.connect(path, isolation_level=None)
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def writer(number):
+        conn = connect()
+        while time.monotonic() < deadline:
+            try:
+                conn.execute('BEGIN')
+                conn.execute('SELECT COUNT(*) FROM comment WHERE post_id = ?',
+                             (number,)).fetchone()
+                conn.execute('INSERT INTO comment (post_id, text, created) '
+                             'VALUES (?, ?, ?)',
+                             (number, 'Комментарий' * 10, time.time()))
+                conn.execute('COMMIT')
+                event = 'writes'
+            except sqlite3.OperationalError:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                event = 'locked'
+            with lock:
+                counts[event] += 1
+        conn.close()
+
+    def reader(number):
+        conn = connect()
+        while time.monotonic() < deadline:
+            try:
+                conn.execute('SELECT id, text FROM comment WHERE post_id = ? '
+                             'ORDER BY created DESC LIMIT 10',
+                             (number % max(writers, 1),)).fetchall()
+                event = 'reads'
+            except sqlite3.OperationalError:
+                event = 'locked'
+            with lock:
+                counts[event] += 1
+        conn.close()
+
+    threads = ([threading.Thread(target=writer, args=(number,))
+                for number in range(writers)]
+               + [threading.Thread(target=reader, args=(number,))
+                  for number in range(readers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite с настройками '
+            'по умолчанию и с SQLITE_PRAGMAS при параллельной нагрузке.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        duration = options['duration']
+        variants = (('по умолчанию', {}),
+                    ('SQLITE_PRAGMAS', settings.SQLITE_PRAGMAS))
+        try:
+            for number, (title, pragmas) in enumerate(variants):
+                path = os.path.join(directory, f'{number}.sqlite3')
+                with sqlite3.connect(path) as conn:
+                    conn.execute(SCHEMA)
+                    conn.execute(INDEX)
+                counts = run(path, pragmas, options['writers'],
+                             options['readers'], duration)
+                self.stdout.write(
+                    f'{title}: записей {counts["writes"] / duration:.0f}/с, '
+                    f'чтений {counts["reads"] / duration:.0f}/с, '
+                    f'блокировок {counts["locked"]}')
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
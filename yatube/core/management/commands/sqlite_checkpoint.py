@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.sqlite import CHECKPOINT_MODES, checkpoint
+
+
+class Command(BaseCommand):
+    help = 'Переносит журнал WAL в файл базы SQLite и обрезает его.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', default='TRUNCATE',
+                            choices=CHECKPOINT_MODES)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        conn = connections[options['database']]
+        if conn.vendor != 'sqlite':
+            raise CommandError('Checkpoint нужен только для SQLite.')
+        busy, log, moved = checkpoint(options['mode'], conn)
+        self.stdout.write(
+            f'Кадров в WAL: {log}, перенесено: {moved}'
+            + (', часть занята читателями.' if busy else '.'))
@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control)
+
+from . import cache, db_router, purge
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'primary_db'
+MESSAGES_COOKIE = 'messages'
+PAGE_CACHE_PREFIX = 'page'
+PLACEHOLDERS = re.compile(r'\((\s*%s\s*,)*\s*%s\s*\)')
+
+
+class ReplicaStickinessMiddleware:
+    """Читает из основной базы в пишущих запросах и сразу после них.
+
+    Запрос, который что-то записал, ставит короткоживущую куку: редирект
+    после создания поста или комментария уже не попадет на отстающую
+    реплику.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        db_router.reset(pinned=request.method not in SAFE_METHODS
+                        or STICKY_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            wrote = db_router.wrote()
+        finally:
+            db_router.reset()
+        if wrote:
+            response.set_cookie(STICKY_COOKIE, '1',
+                                max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+def fingerprint(sql):
+    """Короткий отпечаток формы запроса: без значений и длины списков IN."""
+    shape = PLACEHOLDERS.sub('(...)', ' '.join(sql.split()))
+    return hashlib.md5(shape.encode()).hexdigest()[:8]
+
+
+class QueryStats:
+    """execute_wrapper, который считает запросы и их время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """Формы запросов, выполненные больше одного раза (похоже на N+1)."""
+        return {shape: number for shape, number in self.shapes.most_common()
+                if number > 1}
+
+
+class QueryBudgetMiddleware:
+    """Число и время запросов к базе для каждого view.
+
+    Превышение QUERY_BUDGETS[view_name] пишется в лог. С
+    QUERY_STATS_HEADERS статистика уходит в заголовки X-DB-*.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(stats))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else ''
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        if budget is not None and stats.count > budget:
+            logger.warning('%s: %s запросов при бюджете %s, повторы: %s',
+                           view_name, stats.count, budget,
+                           stats.duplicates())
+        if settings.QUERY_STATS_HEADERS:
+            response['X-View-Name'] = view_name
+            response['X-DB-Queries'] = str(stats.count)
+            response['X-DB-Time'] = f'{stats.duration * 1000:.1f}'
+            response['X-DB-Duplicates'] = ', '.join(
+                f'{shape}x{number}'
+                for shape, number in stats.duplicates().items())
+        return response
+
+
+def cache_for_anonymous(request, *names):
+    """Разрешает сохранить страницу для анонимных читателей.
+
+    Страница живет в кэше, пока не сменится версия одной из лент names.
+    Версии запоминаются до чтения данных: правка посреди рендера не
+    оставит в кэше устаревшую страницу под новой версией.
+    """
+    request.page_cache_feeds = cache.get_versions(*names)
+
+
+class AnonymousPageCacheMiddleware:
+    """Готовые страницы для анонимных GET-запросов по пути и параметрам.
+
+    Стоит до сессий и разбора URL: попадание в кэш отдается без них.
+    Запрос с кукой сессии, сообщений или основной базы идет мимо кэша.
+    Сохраняются только страницы, view которых вызвал cache_for_anonymous.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.applies(request):
+            return self.get_response(request)
+        key = self.key(request)
+        entry = django_cache.get(key)
+        if entry is not None:
+            if (cache.get_versions(*entry['versions'])
+                    == entry['versions']):
+                cache.record('page.hit')
+                return self.cached(request, entry, 'hit')
+            # Страницу уже пересобирает другой воркер: пока отдаем старую.
+            if not cache.lock(key):
+                cache.record('cache.stale')
+                return self.cached(request, entry, 'stale')
+        cache.record('page.miss')
+        try:
+            response = self.get_response(request)
+            if self.storable(request, response):
+                self.share(response, request.page_cache_feeds)
+                django_cache.set(key, {
+                    'versions': request.page_cache_feeds,
+                    'status': response.status_code,
+                    'headers': list(response.items()),
+                    'content': response.content,
+                }, settings.PAGE_CACHE_TIMEOUT)
+        finally:
+            if entry is not None:
+                cache.unlock(key)
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    def cached(self, request, entry, state):
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in entry['headers']:
+            response[header] = value
+        response['X-Page-Cache'] = state
+        if state == 'stale':
+            # Прокси уже получил PURGE и не должен запомнить старую копию.
+            patch_cache_control(response, s_maxage=0)
+        return get_conditional_response(
+            request, etag=response.get('ETag'), response=response)
+
+    def applies(self, request):
+        cookies = {settings.SESSION_COOKIE_NAME, STICKY_COOKIE,
+                   MESSAGES_COOKIE}
+        return (request.method == 'GET'
+                and not cookies.intersection(request.COOKIES))
+
+    def key(self, request):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return f'{PAGE_CACHE_PREFIX}:{path}'
+
+    def share(self, response, names):
+        """Разрешает прокси хранить страницу и сбрасывать ее по лентам.
+
+        Браузер каждый раз сверяет ETag: его копию PURGE не сбросит.
+        """
+        response[purge.SURROGATE_KEY_HEADER] = ' '.join(sorted(names))
+        patch_cache_control(response, public=True, max_age=0,
+                            s_maxage=settings.PROXY_MAX_AGE)
+
+    def storable(self, request, response):
+        return (hasattr(request, 'page_cache_feeds')
+                and response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not request.user.is_authenticated)
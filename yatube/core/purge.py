@@ -0,0 +1,59 @@
+import logging
+import threading
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+
+_local = threading.local()
+
+
+def batches(keys, size):
+    keys = sorted(keys)
+    for start in range(0, len(keys), size):
+        yield keys[start:start + size]
+
+
+def send(keys):
+    """Сбрасывает keys на всех прокси из PURGE_URLS.
+
+    Ключи уходят пачками в заголовке Surrogate-Key, чтобы заголовок не
+    вырос сверх лимита прокси. Недоступный прокси не ломает запись:
+    ошибка пишется в лог, страницы доживут до s-maxage.
+    """
+    for url in settings.PURGE_URLS:
+        for batch in batches(keys, settings.PURGE_BATCH_SIZE):
+            request = urllib.request.Request(
+                url, method=settings.PURGE_METHOD,
+                headers={SURROGATE_KEY_HEADER: ' '.join(batch)})
+            try:
+                with urllib.request.urlopen(
+                        request, timeout=settings.PURGE_TIMEOUT):
+                    pass
+            except (urllib.error.URLError, OSError) as error:
+                logger.warning('Не удалось сбросить кэш прокси %s: %s',
+                               url, error)
+
+
+def _flush():
+    keys = _local.__dict__.pop('keys', None)
+    if keys:
+        send(keys)
+
+
+def schedule(*keys):
+    """Сбрасывает keys у прокси после коммита текущей транзакции.
+
+    Ключи всех изменений транзакции копятся и уходят одним запросом.
+    После отката ключи дождутся следующего коммита: лишний сброс
+    безопасен, а пропущенный оставил бы устаревшую страницу.
+    """
+    if not settings.PURGE_URLS:
+        return
+    _local.__dict__.setdefault('keys', set()).update(keys)
+    transaction.on_commit(_flush)
@@ -0,0 +1,68 @@
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+def is_memory(conn):
+    name = str(conn.settings_dict['NAME'])
+    return name == ':memory:' or 'mode=memory' in name
+
+
+def configure(sender, connection, **kwargs):
+    """Включает WAL и прагмы SQLITE_PRAGMAS для каждого нового соединения.
+
+    Базу в памяти (тесты) не трогает: WAL для нее не поддерживается.
+    """
+    if connection.vendor != 'sqlite' or is_memory(connection):
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(error):
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_lock(function):
+    """Повторяет транзакцию, если SQLite ответил «database is locked».
+
+    busy_timeout не спасает, когда транзакция начала читать, а писатель
+    успел зафиксировать изменения раньше: SQLite сразу возвращает
+    SQLITE_BUSY. Такую транзакцию можно только начать заново, поэтому
+    декоратор ставится снаружи transaction.atomic.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        attempts = settings.SQLITE_LOCK_RETRIES
+        for attempt in range(attempts + 1):
+            try:
+                return function(*args, **kwargs)
+            except OperationalError as error:
+                if (attempt == attempts or not is_locked(error)
+                        or connection.in_atomic_block):
+                    raise
+                delay = settings.SQLITE_LOCK_BACKOFF * 2 ** attempt
+                logger.warning('SQLite занята, повтор %s через %.3f с',
+                               attempt + 1, delay)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+    return wrapper
+
+
+def checkpoint(mode='TRUNCATE', conn=connection):
+    """Переносит WAL в основной файл; (занято, кадров в WAL, перенесено)."""
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f'Неизвестный режим checkpoint: {mode}')
+    with conn.cursor() as cursor:
+        cursor.execute(f'PRAGMA wal_checkpoint({mode})')
+        return cursor.fetchone()
+
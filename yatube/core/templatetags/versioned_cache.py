@@ -0,0 +1,49 @@
+from django import template
+
+from core.cache import fetch, record, stale_key, versioned_key
+
+register = template.Library()
+
+
+class VersionedCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, feeds, vary_on):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.feeds = feeds
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        feeds = self.feeds.resolve(context)
+        if isinstance(feeds, str):
+            feeds = [feeds]
+        prefix = f'template.cache.{self.fragment_name}'
+        parts = [var.resolve(context) for var in self.vary_on]
+        rendered = []
+
+        def build():
+            rendered.append(True)
+            return self.nodelist.render(context)
+        value = fetch(versioned_key(prefix, feeds, *parts), build,
+                      int(timeout), stale=stale_key(prefix, feeds, *parts))
+        record('fragment.miss' if rendered else 'fragment.hit')
+        return value
+
+
+@register.tag
+def versioned_cache(parser, token):
+    """Кэширует фрагмент до изменения версии одной из лент.
+
+    {% versioned_cache timeout fragment_name feeds [var1 var2 ...] %}
+    """
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 4:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]} требует минимум три аргумента.')
+    return VersionedCacheNode(
+        nodelist, parser.compile_filter(tokens[1]), tokens[2],
+        parser.compile_filter(tokens[3]),
+        [parser.compile_filter(token) for token in tokens[4:]])
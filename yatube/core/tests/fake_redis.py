@@ -0,0 +1,162 @@
+import fnmatch
+import socketserver
+import threading
+import time
+
+from core.cache_backends import INCR_SCRIPT
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Подмножество команд Redis, которым пользуется RedisCache."""
+
+    def handle(self):
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            name, args = command[0].upper().decode(), command[1:]
+            with self.server.lock:
+                try:
+                    reply = getattr(self, f'cmd_{name.lower()}')(*args)
+                except AttributeError:
+                    reply = Error(f'ERR unknown command {name}')
+            self.wfile.write(encode(reply))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    @property
+    def data(self):
+        now = time.time()
+        store = self.server.store
+        for key in [key for key, (_, expires) in store.items()
+                    if expires is not None and expires <= now]:
+            del store[key]
+        return store
+
+    def cmd_ping(self):
+        return Status('PONG')
+
+    def cmd_select(self, db):
+        return Status('OK')
+
+    def cmd_get(self, key):
+        item = self.data.get(key)
+        return None if item is None else item[0]
+
+    def cmd_mget(self, *keys):
+        return [self.cmd_get(key) for key in keys]
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        exists = key in self.data
+        if (b'NX' in options and exists) or (b'XX' in options and not exists):
+            return None
+        expires = None
+        if b'PX' in options:
+            milliseconds = int(options[options.index(b'PX') + 1])
+            expires = time.time() + milliseconds / 1000
+        self.data[key] = (value, expires)
+        return Status('OK')
+
+    def cmd_del(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def cmd_exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    def cmd_incrby(self, key, delta):
+        value, expires = self.data.get(key, (b'0', None))
+        try:
+            value = int(value) + int(delta)
+        except ValueError:
+            return Error('ERR value is not an integer or out of range')
+        self.data[key] = (str(value).encode(), expires)
+        return value
+
+    def cmd_eval(self, script, numkeys, *args):
+        """Понимает только INCR_SCRIPT из RedisCache."""
+        if script.decode() != INCR_SCRIPT:
+            return Error('ERR unknown script')
+        key, delta = args
+        if key not in self.data:
+            return None
+        return self.cmd_incrby(key, delta)
+
+    def cmd_pexpire(self, key, milliseconds):
+        if key not in self.data:
+            return 0
+        self.data[key] = (self.data[key][0],
+                          time.time() + int(milliseconds) / 1000)
+        return 1
+
+    def cmd_persist(self, key):
+        if key not in self.data or self.data[key][1] is None:
+            return 0
+        self.data[key] = (self.data[key][0], None)
+        return 1
+
+    def cmd_scan(self, cursor, *options):
+        pattern = '*'
+        if b'MATCH' in options:
+            pattern = options[options.index(b'MATCH') + 1].decode()
+        keys = [key for key in self.data
+                if fnmatch.fnmatchcase(key.decode(), pattern)]
+        return [b'0', keys]
+
+    def cmd_flushdb(self):
+        self.data.clear()
+        return Status('OK')
+
+
+class Status(str):
+    pass
+
+
+class Error(str):
+    pass
+
+
+def encode(reply):
+    if isinstance(reply, Status):
+        return b'+%s\r\n' % reply.encode()
+    if isinstance(reply, Error):
+        return b'-%s\r\n' % reply.encode()
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    return b'*%d\r\n' % len(reply) + b''.join(encode(item) for item in reply)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """Redis в памяти процесса для тестов: with FakeRedisServer() as s."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeRedisHandler)
+        self.store = {}
+        self.lock = threading.Lock()
+
+    @property
+    def location(self):
+        return 'redis://%s:%d/0' % self.server_address
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,75 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache as django_cache
+from django.test import SimpleTestCase
+
+from core import cache
+
+
+class FetchTests(SimpleTestCase):
+    """Пересчет значения одним воркером и старые копии для остальных."""
+
+    def setUp(self):
+        cache.flush_stats()
+        django_cache.clear()
+        self.build = mock.Mock(return_value='новое')
+
+    def events(self):
+        return cache.stats('cache.recompute', 'cache.early', 'cache.stale')
+
+    def test_miss_then_hit(self):
+        for _ in range(2):
+            self.assertEqual(cache.fetch('key', self.build, 60), 'новое')
+        self.build.assert_called_once()
+        self.assertEqual(self.events()['cache.recompute'], 1)
+
+    def test_stale_while_locked(self):
+        """Пока ключ пересчитывают, отдается последнее значение."""
+        cache.fetch('old', lambda: 'старое', 60, stale='stale')
+        self.assertTrue(cache.lock('new'))
+
+        value = cache.fetch('new', self.build, 60, stale='stale')
+
+        self.assertEqual(value, 'старое')
+        self.build.assert_not_called()
+        self.assertEqual(self.events()['cache.stale'], 1)
+
+    def test_locked_without_copy_builds(self):
+        """Без старой копии ждать нечего: воркер считает сам."""
+        self.assertTrue(cache.lock('key'))
+        self.assertEqual(cache.fetch('key', self.build, 60), 'новое')
+        # Чужая блокировка остается на месте.
+        self.assertFalse(cache.lock('key'))
+
+    def test_lock_released_on_error(self):
+        with self.assertRaises(ValueError):
+            cache.fetch('key', mock.Mock(side_effect=ValueError), 60)
+        self.assertTrue(cache.lock('key'))
+
+    def test_early_recompute(self):
+        """Запись, которую долго считали, обновляется до истечения."""
+        django_cache.set('key', cache.Entry('старое', 1.0, time.time() + 5),
+                         60)
+        with mock.patch('random.random', return_value=0):
+            self.assertEqual(cache.fetch('key', self.build, 60), 'старое')
+        with mock.patch('random.random', return_value=0.9999999):
+            self.assertEqual(cache.fetch('key', self.build, 60), 'новое')
+        self.assertEqual(self.events()['cache.early'], 1)
+
+    def test_early_recompute_locked_serves_entry(self):
+        django_cache.set('key', cache.Entry('старое', 1.0, time.time()), 60)
+        self.assertTrue(cache.lock('key'))
+        self.assertEqual(cache.fetch('key', self.build, 60), 'старое')
+        self.build.assert_not_called()
+
+    def test_events_counted_in_process(self):
+        """Событие не пишет в общий кэш, пока не пришло время переноса."""
+        with mock.patch.object(django_cache, 'incr') as incr:
+            cache.record('cache.stale')
+        incr.assert_not_called()
+        self.assertEqual(self.events()['cache.stale'], 1)
+
+    def test_old_format_is_miss(self):
+        django_cache.set('key', '<div>старое</div>', 60)
+        self.assertEqual(cache.fetch('key', self.build, 60), 'новое')
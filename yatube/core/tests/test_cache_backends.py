@@ -0,0 +1,160 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.cache_backends import RedisCache, RedisConnection, SQLiteCache
+from core.tests.fake_redis import FakeRedisServer
+
+WORKERS = 4
+INCREMENTS = 50
+
+
+def worker(backend, location, number):
+    """Отдельный процесс: свой экземпляр кэша, общий счетчик."""
+    cache = backend(location, {'KEY_PREFIX': 'yatube'})
+    for _ in range(INCREMENTS):
+        cache.incr('counter')
+    cache.set(f'worker:{number}', os.getpid())
+
+
+class CacheBackendMixin:
+    """Общие проверки для бэкендов, разделяемых между процессами."""
+
+    def make_cache(self, **params):
+        return self.backend(self.location,
+                            {'KEY_PREFIX': 'yatube', **params})
+
+    def test_basic_operations(self):
+        """get/set/add/delete/get_many работают как в Django."""
+        cache = self.make_cache()
+        cache.set('key', {'value': 1})
+
+        self.assertEqual(cache.get('key'), {'value': 1})
+        self.assertFalse(cache.add('key', 'other'))
+        self.assertTrue(cache.add('new', 'value'))
+        self.assertEqual(cache.get_many(['key', 'new', 'missing']),
+                         {'key': {'value': 1}, 'new': 'value'})
+
+        cache.delete('key')
+
+        self.assertIsNone(cache.get('key'))
+
+    def test_incr(self):
+        """incr атомарен и падает на отсутствующем ключе."""
+        cache = self.make_cache()
+        cache.set('number', 1)
+
+        self.assertEqual(cache.incr('number', 5), 6)
+        self.assertEqual(cache.get('number'), 6)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_expired_timeout(self):
+        """Нулевой timeout удаляет значение."""
+        cache = self.make_cache()
+        cache.set('key', 'value', 0)
+
+        self.assertIsNone(cache.get('key'))
+
+    def test_namespaces(self):
+        """KEY_PREFIX разделяет ключи, clear чистит только свой префикс."""
+        cache = self.make_cache()
+        other = self.backend(self.location, {'KEY_PREFIX': 'other'})
+        cache.set('key', 'yatube')
+        other.set('key', 'other')
+        cache.clear()
+
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(other.get('key'), 'other')
+
+    def test_compression(self):
+        """Большие значения сжимаются и читаются обратно."""
+        cache = self.make_cache(OPTIONS={'COMPRESS_MIN_LENGTH': 100})
+        value = 'пост ' * 1000
+
+        self.assertLess(len(cache._dumps(value)), len(value))
+        cache.set('big', value)
+        self.assertEqual(cache.get('big'), value)
+
+    def test_consistency_between_workers(self):
+        """Несколько процессов видят одни и те же данные."""
+        cache = self.make_cache()
+        cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=worker,
+                            args=(self.backend, self.location, number))
+            for number in range(WORKERS)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+
+        self.assertEqual(cache.get('counter'), WORKERS * INCREMENTS)
+        self.assertEqual(
+            len(cache.get_many([f'worker:{n}' for n in range(WORKERS)])),
+            WORKERS)
+
+
+class SQLiteCacheTests(CacheBackendMixin, SimpleTestCase):
+    backend = SQLiteCache
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+    @mock.patch('core.cache_backends.CULL_PROBABILITY', 1)
+    def test_max_entries(self):
+        """Сверх MAX_ENTRIES удаляются ключи, которые истекут раньше."""
+        cache = self.make_cache(OPTIONS={'MAX_ENTRIES': 10,
+                                         'CULL_FREQUENCY': 2})
+        cache.set('version', 1, None)
+        for number in range(30):
+            cache.set(f'key:{number}', number, 60 + number)
+
+        count = cache._connection.execute(
+            'SELECT COUNT(*) FROM cache').fetchone()[0]
+        self.assertLessEqual(count, 10)
+        self.assertEqual(cache.get('version'), 1)
+        self.assertEqual(cache.get('key:29'), 29)
+        self.assertIsNone(cache.get('key:0'))
+
+
+class RedisCacheTests(CacheBackendMixin, SimpleTestCase):
+    backend = RedisCache
+
+    def setUp(self):
+        self.server = FakeRedisServer().__enter__()
+        self.location = self.server.location
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def test_incr_not_replayed(self):
+        """Оборванный INCRBY не повторяется: он мог уже выполниться."""
+        cache = self.make_cache()
+        cache.set('number', 1)
+        with mock.patch.object(RedisConnection, 'pipeline',
+                               side_effect=ConnectionError) as pipeline:
+            with self.assertRaises(ConnectionError):
+                cache.incr('number')
+            self.assertEqual(pipeline.call_count, 1)
+            with self.assertRaises(ConnectionError):
+                cache.get('number')
+            self.assertEqual(pipeline.call_count, 3)
+        self.assertEqual(cache.get('number'), 1)
+
+    def test_incr_non_integer(self):
+        cache = self.make_cache()
+        cache.set('text', 'значение')
+        with self.assertRaises(ValueError):
+            cache.incr('text')
@@ -0,0 +1,101 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core import db_router
+from core.middleware import STICKY_COOKIE
+from posts.models import Post
+from posts.tests.utils import SearchIndexMixin
+
+User = get_user_model()
+REPLICAS = ('replica_1', 'replica_2')
+
+
+@override_settings(DATABASE_REPLICAS=list(REPLICAS))
+class ReplicaRouterTests(SearchIndexMixin, TransactionTestCase):
+    """Чтение с реплик-файлов SQLite, запись и липкость — основная база."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for alias in REPLICAS + ('replica_broken',):
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(self.directory, f'{alias}.sqlite3'),
+            }
+        connections.databases['replica_broken']['NAME'] = os.path.join(
+            self.directory, 'missing', 'db.sqlite3')
+        self.user = User.objects.create_user(username='auth')
+        self.old = Post.objects.create(author=self.user, text='Старый пост')
+        self.replicate()
+        self.new = Post.objects.create(author=self.user, text='Новый пост')
+        db_router.reset()
+
+    def tearDown(self):
+        super().tearDown()
+        db_router.reset()
+        db_router._down.clear()
+        for alias in REPLICAS + ('replica_broken',):
+            connections[alias].close()
+            delattr(connections._connections, alias)
+            del connections.databases[alias]
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def replicate(self):
+        """Снимок основной базы в файлы реплик."""
+        source = connections['default']
+        source.ensure_connection()
+        for alias in REPLICAS:
+            target = sqlite3.connect(connections.databases[alias]['NAME'])
+            source.connection.backup(target)
+            target.close()
+
+    def test_reads_from_replicas(self):
+        """Чтение идет с реплики, которая еще не видит новый пост."""
+        self.assertIn(db_router.ReplicaRouter().db_for_read(Post), REPLICAS)
+        self.assertTrue(Post.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(Post.objects.filter(pk=self.new.pk).exists())
+
+        with db_router.use_primary():
+            self.assertTrue(Post.objects.filter(pk=self.new.pk).exists())
+
+    def test_write_pins_primary(self):
+        """После записи запрос дочитывает из основной базы."""
+        post = Post.objects.create(author=self.user, text='Еще пост')
+
+        self.assertTrue(db_router.wrote())
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+
+    def test_sticky_after_redirect(self):
+        """Автор видит свой пост сразу после редиректа."""
+        client = Client()
+        client.force_login(self.user)
+        db_router.reset()
+
+        response = client.post(reverse('posts:post_create'),
+                               data={'text': 'Пост с редиректа'},
+                               follow=True)
+
+        self.assertEqual(response.client.cookies[STICKY_COOKIE]['max-age'],
+                         10)
+        self.assertContains(response, 'Пост с редиректа')
+        self.assertFalse(
+            Post.objects.filter(text='Пост с редиректа').exists())
+
+    @override_settings(DATABASE_REPLICAS=['replica_broken', 'replica_1'])
+    def test_failover(self):
+        """Недоступная реплика выключается, при отказе всех — основная."""
+        router = db_router.ReplicaRouter()
+
+        self.assertEqual({router.db_for_read(Post) for _ in range(10)},
+                         {'replica_1'})
+        self.assertFalse(db_router.is_healthy('replica_broken'))
+
+        db_router.mark_down('replica_1')
+
+        self.assertEqual(router.db_for_read(Post), 'default')
@@ -0,0 +1,87 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+
+from core import cache, purge
+
+
+class PurgeReceiver(BaseHTTPRequestHandler):
+    """Прокси-заглушка: запоминает метод и ключи каждого сброса."""
+
+    def handle_purge(self):
+        self.server.received.append(
+            (self.command, self.headers.get(purge.SURROGATE_KEY_HEADER)))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_PURGE = do_BAN = handle_purge
+
+    def log_message(self, *args):
+        pass
+
+
+class PurgeTests(TransactionTestCase):
+    """Сброс кэша прокси по суррогатным ключам после коммита."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(('127.0.0.1', 0), PurgeReceiver)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/'
+        threading.Thread(target=cls.server.serve_forever,
+                         daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.received = []
+        settings = override_settings(PURGE_URLS=[self.url])
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_purge_after_commit_in_one_batch(self):
+        with transaction.atomic():
+            cache.bump('index', 'group:1')
+            cache.bump('profile:2')
+            self.assertEqual(self.server.received, [])
+
+        self.assertEqual(self.server.received,
+                         [('PURGE', 'group:1 index profile:2')])
+
+    def test_bump_outside_transaction(self):
+        cache.bump('index')
+        self.assertEqual(self.server.received, [('PURGE', 'index')])
+
+    @override_settings(PURGE_BATCH_SIZE=2, PURGE_METHOD='BAN')
+    def test_batches_and_method(self):
+        cache.bump('a', 'b', 'c')
+        self.assertEqual(self.server.received,
+                         [('BAN', 'a b'), ('BAN', 'c')])
+
+    def test_rolled_back_keys_sent_with_next_commit(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            cache.bump('index')
+            raise ValueError
+        self.assertEqual(self.server.received, [])
+
+        cache.bump('group:1')
+        self.assertEqual(self.server.received, [('PURGE', 'group:1 index')])
+
+    def test_unreachable_proxy_logged(self):
+        self.server.received = []
+        with override_settings(PURGE_URLS=['http://127.0.0.1:9/', self.url]):
+            with self.assertLogs('core.purge', 'WARNING'):
+                cache.bump('index')
+        self.assertEqual(self.server.received, [('PURGE', 'index')])
+
+    @override_settings(PURGE_URLS=[])
+    def test_disabled_without_urls(self):
+        cache.bump('index')
+        self.assertEqual(self.server.received, [])
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import OperationalError, connections
+from django.test import SimpleTestCase, override_settings
+
+from core.sqlite import retry_on_lock
+
+
+class SQLiteModeTests(SimpleTestCase):
+    """Прагмы файловой SQLite, повтор при блокировке и checkpoint."""
+
+    databases = {'sqlite_file'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        connections.databases['sqlite_file'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.directory, 'db.sqlite3'),
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['sqlite_file'].close()
+        delattr(connections._connections, 'sqlite_file')
+        del connections.databases['sqlite_file']
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def pragma(self, name):
+        with connections['sqlite_file'].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """Новое соединение с файлом работает в WAL с нашими прагмами."""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -64000)
+
+    def test_checkpoint_command(self):
+        """Команда переносит WAL в базу и обрезает журнал."""
+        with connections['sqlite_file'].cursor() as cursor:
+            cursor.execute('CREATE TABLE IF NOT EXISTS t (x INTEGER)')
+            cursor.execute('INSERT INTO t VALUES (1)')
+        out = StringIO()
+
+        call_command('sqlite_checkpoint', database='sqlite_file', stdout=out)
+
+        self.assertIn('перенесено', out.getvalue())
+        self.assertEqual(os.path.getsize(os.path.join(
+            self.directory, 'db.sqlite3-wal')), 0)
+
+    @override_settings(SQLITE_LOCK_RETRIES=2, SQLITE_LOCK_BACKOFF=0)
+    def test_retry_on_lock(self):
+        """Транзакция повторяется только при блокировке и не бесконечно."""
+        locked = OperationalError('database is locked')
+        flaky = mock.Mock(side_effect=[locked, locked, 'ok'])
+        broken = mock.Mock(side_effect=OperationalError('no such table'))
+        stuck = mock.Mock(side_effect=locked)
+
+        self.assertEqual(retry_on_lock(flaky)(), 'ok')
+        with self.assertRaises(OperationalError):
+            retry_on_lock(broken)()
+        with self.assertRaises(OperationalError):
+            retry_on_lock(stuck)()
+        self.assertEqual(broken.call_count, 1)
+        self.assertEqual(stuck.call_count, 3)
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Group, Post
 
 
@@ -13,6 +14,13 @@ class PostAdmin(admin.ModelAdmin):
     list_editable = ('group',)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по тому же полнотекстовому индексу, что и на сайте."""
+        if not search_term:
+            return queryset, False
+        found, _ = search.ranked(queryset, search_term)
+        return found, False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -0,0 +1,272 @@
+import functools
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET, require_http_methods
+
+from core.cache import fetch, stale_key, versioned_key
+from core.sqlite import retry_on_lock
+from . import counters, feeds, thumbnails, timeline
+from .forms import CommentForm
+from .models import Comment, Group, Post
+from .utils import paginate_pls
+
+User = get_user_model()
+
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+def image(post):
+    if not post.image:
+        return None
+    return {'url': post.image.url, 'width': post.image_width,
+            'height': post.image_height}
+
+
+# Поле ответа: (колонки для only(), значение). Через ?fields= клиент
+# выбирает нужные поля, и лишние колонки не читаются из базы.
+POST_FIELDS = {
+    'id': (('id',), lambda post: post.id),
+    'text': (('text',), lambda post: post.text),
+    'pub_date': (('pub_date',), lambda post: post.pub_date),
+    'author': (('author', 'author__username'),
+               lambda post: post.author.username),
+    'group': (('group', 'group__slug'),
+              lambda post: post.group.slug if post.group else None),
+    'comment_count': (('comment_count',), lambda post: post.comment_count),
+    'image': (('image', 'image_width', 'image_height'), image),
+    'thumbnail': (('image',),
+                  lambda post: thumbnails.cached_image(post.image)),
+}
+
+COMMENT_FIELDS = {
+    'id': (('id',), lambda comment: comment.id),
+    'post': (('post',), lambda comment: comment.post_id),
+    'author': (('author', 'author__username'),
+               lambda comment: comment.author.username),
+    'text': (('text',), lambda comment: comment.text),
+    'created': (('created',), lambda comment: comment.created),
+}
+
+GROUP_FIELDS = {
+    'slug': (('slug',), lambda group: group.slug),
+    'title': (('title',), lambda group: group.title),
+    'description': (('description',), lambda group: group.description),
+}
+
+PROFILE_FIELDS = {
+    'username': (('username',), lambda user: user.username),
+    'first_name': (('first_name',), lambda user: user.first_name),
+    'last_name': (('last_name',), lambda user: user.last_name),
+    'post_count': ((), lambda user: counters.for_user(user).post_count),
+    'follower_count': (
+        (), lambda user: counters.for_user(user).follower_count),
+    'following_count': (
+        (), lambda user: counters.for_user(user).following_count),
+}
+
+
+class FieldError(ValueError):
+    pass
+
+
+def requested_fields(request, available):
+    """Поля из ?fields=a,b в порядке запроса; без параметра — все."""
+    value = request.GET.get('fields', '')
+    names = list(dict.fromkeys(name.strip() for name in value.split(',')
+                               if name.strip()))
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise FieldError(f'Неизвестные поля: {", ".join(unknown)}')
+    return names or list(available)
+
+
+def narrow(queryset, names, available, ordering=()):
+    """Читает из базы только колонки выбранных полей и ключа сортировки."""
+    columns = {column for name in names
+               for column in available[name][0]}
+    columns.update(field.lstrip('-') for field in ordering)
+    relations = {column.rsplit('__', 1)[0] for column in columns
+                 if '__' in column}
+    queryset = queryset.select_related(None).only(*columns)
+    # select_related() без аргументов тянет все внешние ключи.
+    return queryset.select_related(*relations) if relations else queryset
+
+
+def serialize(obj, names, available):
+    return {name: available[name][1](obj) for name in names}
+
+
+def api_response(data, status=200, public=True):
+    response = JsonResponse(data, status=status,
+                            json_dumps_params=JSON_PARAMS)
+    if public:
+        patch_cache_control(response, public=True,
+                            max_age=settings.API_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def api_error(message, status=400):
+    return api_response({'error': message}, status, public=False)
+
+
+def api_view(function):
+    """Ошибки в ?fields= отдаются как 400, а не как страница ошибки."""
+    @functools.wraps(function)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return function(request, *args, **kwargs)
+        except FieldError as error:
+            return api_error(str(error))
+    return wrapper
+
+
+def api_login_required(function):
+    """Анонимный клиент API получает 401 вместо редиректа на вход."""
+    @functools.wraps(function)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api_error('Требуется авторизация.', 401)
+        return function(request, *args, **kwargs)
+    return wrapper
+
+
+def page_data(request, queryset, names, available,
+              ordering=('-pub_date', '-id'), per_page=None):
+    """Страница курсорной пагинации со ссылками на соседние страницы."""
+    page = paginate_pls(request, queryset, ordering, per_page)
+    return {
+        'results': [serialize(obj, names, available) for obj in page],
+        'next': (f'{request.path}?{page.next_page_query()}'
+                 if page.has_next() else None),
+        'previous': (f'{request.path}?{page.previous_page_query()}'
+                     if page.has_previous() else None),
+    }
+
+
+def cached_page(request, feed_names, build):
+    """Страница ленты из кэша, пока не сменилась версия одной из лент."""
+    prefix = f'api.{request.resolver_match.view_name}'
+    path = request.get_full_path()
+    return fetch(versioned_key(prefix, feed_names, path), build,
+                 settings.API_CACHE_TIMEOUT,
+                 stale=stale_key(prefix, feed_names, path))
+
+
+def post_page(request, queryset, feed_names):
+    names = requested_fields(request, POST_FIELDS)
+    return api_response(cached_page(request, feed_names, lambda: page_data(
+        request, narrow(queryset, names, POST_FIELDS, ('-pub_date', '-id')),
+        names, POST_FIELDS)))
+
+
+@require_GET
+@api_view
+def post_list(request):
+    return post_page(request, Post.objects.all(), [feeds.INDEX])
+
+
+@require_GET
+@api_view
+def post_detail(request, post_id):
+    names = requested_fields(request, POST_FIELDS)
+    post = get_object_or_404(narrow(Post.objects, names, POST_FIELDS),
+                             pk=post_id)
+    return api_response(serialize(post, names, POST_FIELDS))
+
+
+@require_GET
+@api_view
+def group_list(request):
+    names = requested_fields(request, GROUP_FIELDS)
+    return api_response(page_data(
+        request, narrow(Group.objects, names, GROUP_FIELDS, ('id',)),
+        names, GROUP_FIELDS, ordering=('id',)))
+
+
+@require_GET
+@api_view
+def group_detail(request, slug):
+    names = requested_fields(request, GROUP_FIELDS)
+    group = get_object_or_404(narrow(Group.objects, names, GROUP_FIELDS),
+                              slug=slug)
+    return api_response(serialize(group, names, GROUP_FIELDS))
+
+
+@require_GET
+@api_view
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.only('id'), slug=slug)
+    return post_page(request, Post.objects.filter(group=group),
+                     [feeds.group(group.pk)])
+
+
+@require_GET
+@api_view
+def profile_detail(request, username):
+    names = requested_fields(request, PROFILE_FIELDS)
+    user = get_object_or_404(User.objects.select_related('counters'),
+                             username=username)
+    return api_response(serialize(user, names, PROFILE_FIELDS))
+
+
+@require_GET
+@api_view
+def profile_posts(request, username):
+    author = get_object_or_404(User.objects.only('id'), username=username)
+    return post_page(request, Post.objects.filter(author=author),
+                     [feeds.profile(author.pk)])
+
+
+@require_http_methods(['GET', 'POST'])
+@api_view
+def post_comments(request, post_id):
+    """Комментарии поста от старых к новым; POST добавляет комментарий."""
+    if request.method == 'POST':
+        return add_comment(request, post_id)
+    post = get_object_or_404(Post.objects.only('author_id', 'group_id'),
+                             pk=post_id)
+    names = requested_fields(request, COMMENT_FIELDS)
+    ordering = ('created', 'id')
+    return api_response(cached_page(
+        request, feeds.post_page(post.author_id, post.group_id, post.pk),
+        lambda: page_data(
+            request,
+            narrow(Comment.objects.filter(post=post), names, COMMENT_FIELDS,
+                   ordering),
+            names, COMMENT_FIELDS, ordering,
+            per_page=settings.COMMENTS_PER_PAGE)))
+
+
+@api_login_required
+@retry_on_lock
+@transaction.atomic
+def add_comment(request, post_id):
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    form = CommentForm(request.POST)
+    if not form.is_valid():
+        return api_response({'errors': form.errors}, 400, public=False)
+    comment = form.save(commit=False)
+    comment.author = request.user
+    comment.post = post
+    comment.save()
+    return api_response(serialize(comment, list(COMMENT_FIELDS),
+                                  COMMENT_FIELDS), 201, public=False)
+
+
+@require_GET
+@api_login_required
+@api_view
+def follow_feed(request):
+    """Лента подписок, как на странице follow_index."""
+    names = requested_fields(request, POST_FIELDS)
+    posts = narrow(Post.objects, names, POST_FIELDS, ('-pub_date', '-id'))
+    return api_response(page_data(
+        request, timeline.feed(request.user, posts), names, POST_FIELDS,
+        timeline.ORDERING), public=False)
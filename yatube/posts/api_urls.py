@@ -0,0 +1,20 @@
+from django.urls import path
+
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', api.post_list, name='post_list'),
+    path('posts/<int:post_id>/', api.post_detail, name='post_detail'),
+    path('posts/<int:post_id>/comments/', api.post_comments,
+         name='post_comments'),
+    path('groups/', api.group_list, name='group_list'),
+    path('groups/<slug:slug>/', api.group_detail, name='group_detail'),
+    path('groups/<slug:slug>/posts/', api.group_posts, name='group_posts'),
+    path('profiles/<str:username>/', api.profile_detail,
+         name='profile_detail'),
+    path('profiles/<str:username>/posts/', api.profile_posts,
+         name='profile_posts'),
+    path('follow/', api.follow_feed, name='follow_feed'),
+]
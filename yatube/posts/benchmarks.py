@@ -0,0 +1,220 @@
+import contextlib
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache as django_cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+
+from core import cache
+from . import counters, feeds, timeline, views
+from .models import Comment, Follow, Post
+from .templatetags.post_cards import card_key
+from .utils import encode_cursor, paginate_pls
+
+User = get_user_model()
+
+# Окружение замеров: ничего не зависит от Redis, реплик и фоновых потоков.
+SETTINGS = {
+    'CACHES': {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'DATABASE_ROUTERS': [],
+    'THUMBNAIL_ASYNC': False,
+    'QUERY_STATS_HEADERS': False,
+    'PURGE_URLS': [],
+}
+
+CASES = {}
+
+
+def case(function):
+    """Регистрирует бенчмарк: функция готовит данные и возвращает замер."""
+    CASES[function.__name__] = function
+    return function
+
+
+@contextlib.contextmanager
+def environment():
+    """Временная база SQLite в памяти и временный MEDIA_ROOT."""
+    media_root = tempfile.mkdtemp()
+    old_name = connection.creation.create_test_db(verbosity=0,
+                                                  autoclobber=True)
+    try:
+        with override_settings(MEDIA_ROOT=media_root, **SETTINGS):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+class Fixture:
+    """Общие данные всех бенчмарков, воспроизводимые при одном seed."""
+
+    def __init__(self, posts=5000, comments=500, follows=50, seed=0):
+        call_command('seed', users=100, groups=10, posts=posts, comments=0,
+                     image_ratio=0.3, max_follows=0, seed=seed,
+                     stdout=StringIO())
+        rng = random.Random(seed)
+        self.reader = User.objects.create_user('benchmark')
+        for author_id in (User.objects.exclude(pk=self.reader.pk)
+                          .annotate(total=Count('posts'))
+                          .order_by('-total', 'pk')
+                          .values_list('pk', flat=True)[:follows]):
+            Follow.objects.create(user=self.reader, author_id=author_id)
+        self.post = Post.objects.order_by('-pub_date', '-id').first()
+        user_ids = list(User.objects.values_list('pk', flat=True))
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author_id=rng.choice(user_ids),
+                    text=f'Комментарий {number}')
+            for number in range(comments)
+        ])
+        counters.recount_posts([self.post.pk])
+
+    def request(self, path, user=None, **params):
+        request = RequestFactory().get(path, params)
+        request.user = user or AnonymousUser()
+        request.resolver_match = resolve(path)
+        return request
+
+
+def index_posts():
+    return Post.objects.select_related('group', 'author')
+
+
+def deep_post(share=0.9):
+    """Пост на глубине share от начала ленты и номер его страницы."""
+    position = int(Post.objects.count() * share)
+    return (index_posts().order_by('-pub_date', '-id')[position],
+            position // 10 + 1)
+
+
+@case
+def render_index(fixture):
+    """Рендер главной с десятью post_card из кэша фрагментов."""
+    request = fixture.request(reverse('posts:index'))
+    context = {'page_obj': paginate_pls(request, index_posts()),
+               'feeds': feeds.INDEX}
+
+    def run():
+        cache.bump(feeds.INDEX)
+        render_to_string('posts/index.html', context, request)
+    return run
+
+
+@case
+def render_index_cold(fixture):
+    """Та же главная, но каждая post_card рендерится заново."""
+    request = fixture.request(reverse('posts:index'))
+    page = paginate_pls(request, index_posts())
+    context = {'page_obj': page, 'feeds': feeds.INDEX}
+    keys = [card_key(post, request.resolver_match.view_name)
+            for post in page]
+
+    def run():
+        cache.bump(feeds.INDEX)
+        django_cache.delete_many(keys)
+        render_to_string('posts/index.html', context, request)
+    return run
+
+
+@case
+def paginate_first(fixture):
+    request = fixture.request(reverse('posts:index'))
+    return lambda: list(paginate_pls(request, index_posts()))
+
+
+@case
+def paginate_deep_cursor(fixture):
+    """Страница в конце ленты по курсору: поиск по индексу."""
+    post, number = deep_post()
+    request = fixture.request(
+        reverse('posts:index'),
+        cursor=encode_cursor((post.pub_date, post.id), number))
+    return lambda: list(paginate_pls(request, index_posts()))
+
+
+@case
+def paginate_deep_page(fixture):
+    """Та же глубина по старой ссылке ?page=N, то есть через OFFSET."""
+    _, number = deep_post()
+    request = fixture.request(reverse('posts:index'), page=number)
+    return lambda: list(paginate_pls(request, index_posts()))
+
+
+@case
+def follow_index(fixture):
+    request = fixture.request(reverse('posts:follow_index'), fixture.reader)
+    return lambda: list(paginate_pls(
+        request, timeline.feed(fixture.reader), ordering=timeline.ORDERING))
+
+
+@case
+def post_detail(fixture):
+    """Страница поста со всеми комментариями."""
+    path = reverse('posts:post_detail', args=[fixture.post.pk])
+    request = fixture.request(path)
+    return lambda: views.post_detail(request, fixture.post.pk)
+
+
+@case
+def thumbnail_tags(fixture):
+    """{% post_image %} для десяти постов с готовыми миниатюрами."""
+    template = Template('{% load post_images %}{% for post in posts %}'
+                        '{% post_image post.image as im %}{{ im.url }}'
+                        '{% endfor %}')
+    context = Context({'posts': list(
+        Post.objects.exclude(image='').order_by('-id')[:10])})
+    return lambda: template.render(context)
+
+
+def measure(run, number, repeat):
+    """Миллисекунды на вызов: медиана и минимум по repeat сериям.
+
+    Первый вызов прогревает кэши и не учитывается.
+    """
+    run()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            run()
+        timings.append((time.perf_counter() - started) / number * 1000)
+    return {'median_ms': round(statistics.median(timings), 3),
+            'min_ms': round(min(timings), 3)}
+
+
+def run(names=None, number=20, repeat=10, **sizes):
+    """Прогоняет бенчмарки names (по умолчанию все) на текущей базе."""
+    fixture = Fixture(**sizes)
+    return {name: measure(CASES[name](fixture), number, repeat)
+            for name in names or CASES}
+
+
+def compare(results, baseline, threshold, min_delta=0):
+    """Относительное замедление бенчмарков, вышедших за threshold.
+
+    Сравнивается минимум: медиана сильнее зависит от соседей по машине.
+    Замедление меньше min_delta миллисекунд считается шумом: у быстрых
+    замеров даже четверть — это доли миллисекунды.
+    """
+    regressions = {}
+    for name, row in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous['min_ms']:
+            continue
+        change = row['min_ms'] / previous['min_ms'] - 1
+        if (change > threshold
+                and row['min_ms'] - previous['min_ms'] > min_delta):
+            regressions[name] = change
+    return regressions
@@ -0,0 +1,103 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorCounters, Comment, Follow, Post
+from .utils import batches
+
+User = get_user_model()
+
+AUTHOR_FIELDS = ('post_count', 'follower_count', 'following_count')
+
+
+def for_user(user):
+    """Счетчики пользователя; нет строки — значит, активности не было."""
+    try:
+        return user.counters
+    except AuthorCounters.DoesNotExist:
+        return AuthorCounters(user=user)
+
+
+def bump_author(user_id, **deltas):
+    """Атомарно сдвигает счетчики автора через F()."""
+    updated = AuthorCounters.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+    if not updated:
+        recount_authors([user_id])
+
+
+def bump_comments(post_id, delta):
+    """Атомарно сдвигает счетчик комментариев поста."""
+    Post.objects.filter(pk=post_id).update(
+        comment_count=Greatest(F('comment_count') + delta, 0))
+
+
+def _grouped(queryset, field, ids):
+    return dict(queryset.filter(**{f'{field}__in': ids})
+                .order_by()
+                .values_list(field)
+                .annotate(Count('id')))
+
+
+def recount_authors(user_ids):
+    """Пересчитывает счетчики авторов, возвращает число исправленных."""
+    user_ids = list(user_ids)
+    actual = {
+        'post_count': _grouped(Post.objects, 'author_id', user_ids),
+        'follower_count': _grouped(Follow.objects, 'author_id', user_ids),
+        'following_count': _grouped(Follow.objects, 'user_id', user_ids),
+    }
+    existing = AuthorCounters.objects.in_bulk(user_ids)
+    changed, created = [], []
+    for user_id in user_ids:
+        counters = existing.get(user_id)
+        if counters is None:
+            counters = AuthorCounters(user_id=user_id)
+            created.append(counters)
+        values = {field: actual[field].get(user_id, 0)
+                  for field in AUTHOR_FIELDS}
+        if any(getattr(counters, field) != value
+               for field, value in values.items()):
+            for field, value in values.items():
+                setattr(counters, field, value)
+            if user_id in existing:
+                changed.append(counters)
+    AuthorCounters.objects.bulk_update(changed, AUTHOR_FIELDS)
+    AuthorCounters.objects.bulk_create(created, ignore_conflicts=True)
+    return len(changed) + len(created)
+
+
+def recount_posts(post_ids):
+    """Пересчитывает счетчики комментариев, возвращает число исправленных."""
+    post_ids = list(post_ids)
+    actual = _grouped(Comment.objects, 'post_id', post_ids)
+    changed = []
+    for post in Post.objects.filter(pk__in=post_ids).only('comment_count'):
+        value = actual.get(post.id, 0)
+        if post.comment_count != value:
+            post.comment_count = value
+            changed.append(post)
+    Post.objects.bulk_update(changed, ['comment_count'])
+    return len(changed)
+
+
+def _count(model, field):
+    """Подзапрос: сколько строк model ссылаются полем field на строку."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')), 0)
+
+
+def recount_all(batch_size=500):
+    """Заполняет все счетчики: по одному UPDATE с подзапросом на счетчик."""
+    for user_ids in batches(User.objects, batch_size):
+        AuthorCounters.objects.bulk_create(
+            [AuthorCounters(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True)
+    AuthorCounters.objects.update(
+        post_count=_count(Post, 'author'),
+        follower_count=_count(Follow, 'author'),
+        following_count=_count(Follow, 'user'))
+    Post.objects.update(comment_count=_count(Comment, 'post'))
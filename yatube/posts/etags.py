@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
+
+from core.cache import versioned_key
+from . import counters, feeds
+from .models import Follow, Group, Post
+
+User = get_user_model()
+
+
+def _etag(request, names, *parts):
+    """Версии лент, от которых зависит страница, плюс вошедший пользователь.
+
+    Пользователь нужен из-за шапки, кнопки редактирования и подписки:
+    одна и та же страница у разных читателей выглядит по-разному.
+    """
+    user_id = request.user.pk if request.user.is_authenticated else None
+    return versioned_key('page', names, user_id, *parts)
+
+
+def post_detail(request, post_id):
+    """Правки и комментарии сдвигают версию поста, главная — нет.
+
+    Счетчик постов автора в версии не входит и читается отдельно.
+    """
+    post = (Post.objects.filter(pk=post_id)
+            .values_list('author_id', 'group_id',
+                         'author__counters__post_count').first())
+    if post is None:
+        return None
+    author_id, group_id, post_count = post
+    return _etag(request, feeds.post_page(author_id, group_id, post_id),
+                 post_count)
+
+
+def group_posts(request, slug):
+    group_id = (Group.objects.filter(slug=slug)
+                .values_list('id', flat=True).first())
+    if group_id is None:
+        return None
+    return _etag(request, [feeds.group(group_id)])
+
+
+def profile(request, username):
+    """Счетчики автора и подписка читателя берутся тем же запросом."""
+    authors = User.objects.filter(username=username)
+    fields = ['id', *[f'counters__{field}'
+                      for field in counters.AUTHOR_FIELDS]]
+    if request.user.is_authenticated:
+        authors = authors.annotate(is_followed=Exists(Follow.objects.filter(
+            user=request.user, author=OuterRef('pk'))))
+        fields.append('is_followed')
+    author = authors.values_list(*fields).first()
+    if author is None:
+        return None
+    return _etag(request, [feeds.profile(author[0])], *author[1:])
@@ -0,0 +1,40 @@
+INDEX = 'index'
+
+
+def group(group_id):
+    return f'group:{group_id}'
+
+
+def profile(author_id):
+    return f'profile:{author_id}'
+
+
+def post(post_id):
+    return f'post:{post_id}'
+
+
+def follows(user_id):
+    """Подписки и подписчики: от них зависят счетчики в профиле."""
+    return f'follows:{user_id}'
+
+
+def for_post(author_id, group_id, post_id=None):
+    """Ленты, в которых показывается пост, и страница самого поста."""
+    names = [INDEX, profile(author_id)]
+    if group_id is not None:
+        names.append(group(group_id))
+    if post_id is not None:
+        names.append(post(post_id))
+    return names
+
+
+def post_page(author_id, group_id, post_id):
+    """Страница поста: сам пост с комментариями, его автор и группа.
+
+    Общие ленты сюда не входят: чужой пост на главной эту страницу
+    не меняет.
+    """
+    names = [post(post_id), profile(author_id)]
+    if group_id is not None:
+        names.append(group(group_id))
+    return names
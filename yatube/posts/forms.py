@@ -1,15 +1,61 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.forms import ModelForm
 
+from . import thumbnails, uploads
 from .models import Post, Comment
 
 
 class PostForm(ModelForm):
     """Форма для создания и редактирования поста."""
 
+    upload = forms.CharField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.chunked_upload = None
+
+    def clean(self):
+        """Картинка, загруженная по частям, подставляется вместо файла.
+
+        Она заменяет и картинку редактируемого поста; файл из той же
+        формы важнее. Загрузка проверяется Pillow, как обычный файл.
+        """
+        cleaned_data = super().clean()
+        token = cleaned_data.get('upload')
+        if token and 'image' not in self.changed_data:
+            upload, image = uploads.claim(self.user, token)
+            try:
+                cleaned_data['image'] = self.fields['image'].clean(image)
+            except ValidationError:
+                image.close()
+                raise
+            self.chunked_upload = upload
+        return cleaned_data
+
+    def save(self, commit=True):
+        """Новая картинка уходит на создание миниатюр после коммита."""
+        image_changed = ('image' in self.changed_data
+                         or self.chunked_upload is not None)
+        if image_changed:
+            self.instance.image_width, self.instance.image_height = (
+                thumbnails.image_size(self.cleaned_data.get('image')))
+        post = super().save(commit)
+        if commit and self.chunked_upload is not None:
+            self.cleaned_data['image'].close()
+            uploads.discard(self.chunked_upload)
+            self.chunked_upload = None
+        if commit and image_changed and post.image:
+            name = post.image.name
+            transaction.on_commit(lambda: thumbnails.enqueue(name))
+        return post
+
 
 class CommentForm(ModelForm):
     """Форма для создания и редактирования поста."""
@@ -0,0 +1,106 @@
+import datetime
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmarks
+
+BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+SIZES = ('posts', 'comments', 'follows', 'number', 'repeat')
+
+
+class Command(BaseCommand):
+    help = ('Микробенчмарки рендера и запросов на временной SQLite в памяти. '
+            'С --compare завершается ошибкой, если какой-то замер медленнее '
+            'сохраненного больше чем на --threshold и на --min-delta мс. '
+            'Базовую линию обновляет "manage.py benchmark --save" на '
+            'спокойной машине; файл коммитится вместе с изменением, '
+            'которое меняет замеры.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('cases', nargs='*',
+                            help='Бенчмарки, по умолчанию все: '
+                                 + ', '.join(benchmarks.CASES))
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=500,
+                            help='Комментариев у поста в post_detail.')
+        parser.add_argument('--follows', type=int, default=50)
+        parser.add_argument('--number', type=int, default=20,
+                            help='Вызовов в одной серии.')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Серий, в сравнении участвует лучшая.')
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument('--save', action='store_true',
+                            help='Записать результаты как новую базовую '
+                                 'линию.')
+        parser.add_argument('--compare', action='store_true',
+                            help='Упасть при замедлении относительно '
+                                 'базовой линии.')
+        parser.add_argument('--threshold', type=float, default=0.25)
+        parser.add_argument('--min-delta', type=float, default=1.0,
+                            help='Замедление меньше стольких миллисекунд '
+                                 'считается шумом.')
+
+    def handle(self, *args, **options):
+        unknown = set(options['cases']) - set(benchmarks.CASES)
+        if unknown:
+            raise CommandError(
+                f'Нет бенчмарков: {", ".join(sorted(unknown))}')
+        baseline = self.load(options)
+        with benchmarks.environment():
+            results = benchmarks.run(
+                options['cases'], options['number'], options['repeat'],
+                posts=options['posts'], comments=options['comments'],
+                follows=options['follows'])
+
+        for name, row in results.items():
+            line = (f'{name:22} медиана {row["median_ms"]:9.3f} '
+                    f'мин {row["min_ms"]:9.3f} мс')
+            if name in baseline:
+                change = row['min_ms'] / baseline[name]['min_ms'] - 1
+                line += f'  {change:+.0%}'
+            self.stdout.write(line)
+
+        if options['save']:
+            self.save(results, options)
+        if options['compare']:
+            regressions = benchmarks.compare(results, baseline,
+                                             options['threshold'],
+                                             options['min_delta'])
+            if regressions:
+                raise CommandError('Замедление: ' + ', '.join(
+                    f'{name} {change:+.0%}'
+                    for name, change in regressions.items()))
+
+    def load(self, options):
+        if not os.path.exists(options['baseline']):
+            if options['compare']:
+                raise CommandError(
+                    f'Нет базовой линии {options["baseline"]}, '
+                    'сначала запустите с --save.')
+            return {}
+        with open(options['baseline']) as file:
+            data = json.load(file)
+        stored = data.get('options', {})
+        changed = [key for key in SIZES if stored.get(key) != options[key]]
+        if changed:
+            self.stderr.write('Параметры отличаются от базовой линии: '
+                              + ', '.join(changed))
+        return data['results']
+
+    def save(self, results, options):
+        os.makedirs(os.path.dirname(options['baseline']) or '.',
+                    exist_ok=True)
+        previous = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as file:
+                previous = json.load(file)['results']
+        with open(options['baseline'], 'w') as file:
+            json.dump({
+                'saved': datetime.datetime.now().isoformat(),
+                'options': {key: options[key] for key in SIZES},
+                'results': dict(previous, **results),
+            }, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Базовая линия: {options["baseline"]}')
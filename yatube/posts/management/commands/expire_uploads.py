@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import uploads
+
+
+class Command(BaseCommand):
+    help = ('Удаляет брошенные загрузки по частям старше UPLOAD_TTL и их '
+            'временные файлы. Запускать по расписанию, например из cron.')
+
+    def handle(self, *args, **options):
+        expired, files = uploads.expire()
+        self.stdout.write(
+            f'Удалено загрузок: {expired}, файлов без загрузки: {files}.')
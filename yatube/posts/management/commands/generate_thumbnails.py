@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создает недостающие миниатюры картинок постов.'
+
+    def handle(self, *args, **options):
+        created = 0
+        images = (Post.objects.exclude(image='').order_by()
+                  .values_list('image', flat=True).distinct())
+        for name in images.iterator():
+            if not thumbnails.is_ready(name):
+                thumbnails.generate(name)
+                created += 1
+        self.stdout.write(f'Создано миниатюр: {created}.')
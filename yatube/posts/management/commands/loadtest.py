@@ -0,0 +1,302 @@
+import datetime
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.middleware.csrf import CSRF_TOKEN_LENGTH
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from posts import uploads
+from posts.models import Group, Post
+from posts.urls import urlpatterns
+
+User = get_user_model()
+
+SMALL_GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff'
+             b'!\xf9\x04\x00\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01'
+             b'\x00\x00\x02\x02D\x01\x00;')
+
+
+class Sample:
+    """Существующие объекты для подстановки в URL."""
+
+    def __init__(self, size=200):
+        self.users = list(User.objects.order_by('?')
+                          .values_list('username', flat=True)[:size])
+        self.groups = list(Group.objects.order_by('?')
+                           .values_list('slug', flat=True)[:size])
+        self.posts = list(Post.objects.order_by('?')
+                          .values_list('id', 'author__username')[:size])
+        if not (self.users and self.groups and self.posts):
+            raise CommandError('База пуста, сначала запустите seed.')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Отдает редирект как ответ, как это делает тестовый Client."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    """Клиент с интерфейсом django.test.Client поверх настоящего HTTP.
+
+    Сессия берется из хранилища сессий, поэтому сервер должен работать с
+    той же базой. CSRF-токен подставляется и в cookie, и в заголовок.
+    """
+
+    def __init__(self, base_url, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(NoRedirect)
+        token = get_random_string(CSRF_TOKEN_LENGTH)
+        cookies = {settings.CSRF_COOKIE_NAME: token}
+        if session:
+            cookies[settings.SESSION_COOKIE_NAME] = session
+        self.headers = {
+            'Cookie': '; '.join(f'{name}={value}'
+                                for name, value in cookies.items()),
+            'X-CSRFToken': token,
+        }
+
+    def request(self, method, url, data=None, content_type=None, **extra):
+        headers = dict(self.headers)
+        for name, value in extra.items():
+            if name.startswith('HTTP_'):
+                headers[name[5:].replace('_', '-').title()] = value
+        url = self.base_url + url
+        body = None
+        if method == 'GET':
+            if data:
+                url += '?' + urllib.parse.urlencode(data)
+        elif isinstance(data, bytes):
+            body = data
+            headers['Content-Type'] = content_type
+        else:
+            body = urllib.parse.urlencode(data or {}).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(url, body, headers, method=method)
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                response.read()
+                response.status_code = response.status
+                return response
+        except urllib.error.HTTPError as error:
+            with error:
+                error.read()
+            error.status_code = error.code
+            return error
+
+    def get(self, url, data=None, **extra):
+        return self.request('GET', url, data, **extra)
+
+    def post(self, url, data=None, **extra):
+        return self.request('POST', url, data, **extra)
+
+    def patch(self, url, data=None, **extra):
+        return self.request('PATCH', url, data, **extra)
+
+
+def post_edit(sample, rng, username):
+    own = [post_id for post_id, author in sample.posts if author == username]
+    if not own:
+        return ('get', reverse('posts:post_edit',
+                               args=[rng.choice(sample.posts)[0]]), None, {})
+    return ('post', reverse('posts:post_edit', args=[rng.choice(own)]),
+            {'text': 'Пост, отредактированный нагрузочным тестом'}, {})
+
+
+def upload_chunk(sample, rng, username):
+    upload = uploads.start(User.objects.get(username=username),
+                           'load.gif', len(SMALL_GIF))
+    return ('patch', reverse('posts:upload_chunk', args=[upload.token]),
+            SMALL_GIF, {'content_type': 'application/octet-stream',
+                        'HTTP_UPLOAD_OFFSET': '0'})
+
+
+# Маршрут: (вес в смеси, нужен ли вход, запрос). Запрос получает выборку,
+# генератор случайных чисел и имя вошедшего пользователя и возвращает
+# (метод, url, данные, extra).
+ROUTES = {
+    'index': (30, False, lambda sample, rng, username: (
+        'get', reverse('posts:index'), None, {})),
+    'search': (5, False, lambda sample, rng, username: (
+        'get', reverse('posts:search'),
+        {'q': rng.choice(('город', 'работа', 'жизнь', 'дом'))}, {})),
+    'group_list': (15, False, lambda sample, rng, username: (
+        'get', reverse('posts:group_list', args=[rng.choice(sample.groups)]),
+        None, {})),
+    'post_detail': (20, False, lambda sample, rng, username: (
+        'get', reverse('posts:post_detail',
+                       args=[rng.choice(sample.posts)[0]]), None, {})),
+    'profile': (15, False, lambda sample, rng, username: (
+        'get', reverse('posts:profile', args=[rng.choice(sample.users)]),
+        None, {})),
+    'follow_index': (10, True, lambda sample, rng, username: (
+        'get', reverse('posts:follow_index'), None, {})),
+    'post_create': (2, True, lambda sample, rng, username: (
+        'post', reverse('posts:post_create'),
+        {'text': 'Пост из нагрузочного теста'}, {})),
+    'post_edit': (1, True, post_edit),
+    'add_comment': (3, True, lambda sample, rng, username: (
+        'post', reverse('posts:add_comment',
+                        args=[rng.choice(sample.posts)[0]]),
+        {'text': 'Комментарий из нагрузочного теста'}, {})),
+    'comments': (3, False, lambda sample, rng, username: (
+        'get', reverse('posts:comments',
+                       args=[rng.choice(sample.posts)[0]]), None, {})),
+    'profile_follow': (2, True, lambda sample, rng, username: (
+        'get', reverse('posts:profile_follow',
+                       args=[rng.choice(sample.users)]), None, {})),
+    'profile_unfollow': (1, True, lambda sample, rng, username: (
+        'get', reverse('posts:profile_unfollow',
+                       args=[rng.choice(sample.users)]), None, {})),
+    'upload_start': (1, True, lambda sample, rng, username: (
+        'post', reverse('posts:upload_start'),
+        {'filename': 'load.gif', 'size': len(SMALL_GIF)}, {})),
+    'upload_chunk': (1, True, upload_chunk),
+}
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return 0
+    rank = max(int(round(share * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summary(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Нагружает все маршруты posts смесью анонимных и авторизованных '
+            'запросов и сохраняет перцентили задержек в JSON. Без --url '
+            'запросы идут через тестовый Client в этом же процессе: это '
+            'дымовой прогон, он не учитывает сервер, сеть и GIL. Для '
+            'настоящей нагрузки запустите сервер с той же базой и передайте '
+            'его адрес в --url.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--logged-in', type=float, default=0.3,
+                            help='Доля запросов от вошедших пользователей.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--url',
+                            help='Адрес запущенного сервера, например '
+                                 'http://127.0.0.1:8000. Без него запросы '
+                                 'идут в процессе.')
+        parser.add_argument('--output',
+                            help='Файл с результатами, по умолчанию '
+                                 'loadtest/<время>.json')
+        parser.add_argument('--compare',
+                            help='JSON прошлого прогона для сравнения.')
+
+    def handle(self, *args, **options):
+        missing = {pattern.name for pattern in urlpatterns} - set(ROUTES)
+        if missing:
+            raise CommandError(
+                f'Нет сценария для маршрутов: {", ".join(sorted(missing))}')
+        sample = Sample()
+        latencies = {name: [] for name in ROUTES}
+        errors = Counter()
+        lock = threading.Lock()
+        per_worker = options['requests'] // options['concurrency']
+
+        def worker(number):
+            rng = random.Random(options['seed'] * 1000 + number)
+            username = rng.choice(sample.users)
+            guest, member = Client(), Client()
+            member.force_login(User.objects.get(username=username))
+            if options['url']:
+                guest = HTTPClient(options['url'])
+                member = HTTPClient(
+                    options['url'],
+                    member.cookies[settings.SESSION_COOKIE_NAME].value)
+            public = [name for name, route in ROUTES.items() if not route[1]]
+            for _ in range(per_worker):
+                logged_in = rng.random() < options['logged_in']
+                names = list(ROUTES) if logged_in else public
+                name = rng.choices(
+                    names, [ROUTES[name][0] for name in names])[0]
+                client = member if logged_in else guest
+                method, url, data, extra = ROUTES[name][2](
+                    sample, rng, username)
+                started = time.perf_counter()
+                try:
+                    status = getattr(client, method)(
+                        url, data, **extra).status_code
+                except Exception:
+                    status = 500
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies[name].append(elapsed)
+                    errors[name] += status >= 500
+            connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            workers = [pool.submit(worker, number)
+                       for number in range(options['concurrency'])]
+            for future in workers:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        report = {
+            'started': datetime.datetime.now().isoformat(),
+            'options': {key: options[key] for key in
+                        ('requests', 'concurrency', 'logged_in', 'seed',
+                         'url')},
+            'total': summary(
+                [value for values in latencies.values() for value in values],
+                sum(errors.values()), elapsed),
+            'routes': {name: summary(values, errors[name], elapsed)
+                       for name, values in latencies.items() if values},
+        }
+        self.write(report, options)
+
+    def write(self, report, options):
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'loadtest',
+            f'{datetime.datetime.now():%Y%m%d-%H%M%S}.json')
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+        previous = {}
+        if options['compare']:
+            with open(options['compare']) as file:
+                previous = json.load(file)['routes']
+        for name, row in [('всего', report['total'])] + sorted(
+                report['routes'].items()):
+            line = (f'{name:18} {row["requests"]:6} запр. '
+                    f'{row["rps"]:8} rps  p50 {row["p50_ms"]:8} '
+                    f'p95 {row["p95_ms"]:8} p99 {row["p99_ms"]:8} мс  '
+                    f'ошибок {row["errors"]}')
+            if name in previous and previous[name]['p95_ms']:
+                change = row['p95_ms'] / previous[name]['p95_ms'] - 1
+                line += f'  p95 {change:+.0%}'
+            self.stdout.write(line)
+        self.stdout.write(f'Результаты: {output}')
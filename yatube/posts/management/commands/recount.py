@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import Post
+from posts.utils import batches
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики авторов и постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        authors = sum(counters.recount_authors(ids)
+                      for ids in batches(User.objects.all(), size))
+        posts = sum(counters.recount_posts(ids)
+                    for ids in batches(Post.objects.all(), size))
+        self.stdout.write(
+            f'Исправлено счетчиков: авторов {authors}, постов {posts}.')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+from posts.models import Post
+from posts.utils import batches
+
+
+class Command(BaseCommand):
+    help = ('Перестраивает поисковый индекс постов. Посты переиндексируются '
+            'пачками поверх старого индекса, поиск работает все время.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        search.install()
+        indexed = 0
+        for ids in batches(Post.objects.all(), options['batch_size']):
+            search.index(Post.objects.filter(pk__in=ids)
+                         .values_list('id', 'text'))
+            indexed += len(ids)
+        search.prune()
+        self.stdout.write(f'Проиндексировано постов: {indexed}.')
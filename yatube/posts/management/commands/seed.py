@@ -0,0 +1,189 @@
+import datetime
+import io
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from posts import counters, search, timeline
+from posts.models import AuthorCounters, Comment, Follow, Group, Post
+from posts.utils import batches
+
+User = get_user_model()
+
+IMAGE_SIZES = ((960, 640), (1440, 960), (640, 960), (800, 800))
+
+
+def power_law_weights(count, alpha):
+    """Вес i-го по популярности — 1 / (i + 1) ** alpha."""
+    return [1 / (rank + 1) ** alpha for rank in range(count)]
+
+
+def new_ids(model, start, batch_size):
+    """Первичные ключи строк, вставленных bulk_create после start."""
+    return [pk for ids in batches(model.objects.filter(pk__gt=start),
+                                  batch_size)
+            for pk in ids]
+
+
+def last_id(model):
+    return (model.objects.order_by('-pk')
+            .values_list('pk', flat=True).first() or 0)
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу воспроизводимым набором пользователей, групп, '
+            'постов, комментариев и подписок со степенным распределением.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--image-ratio', type=float, default=0.2)
+        parser.add_argument('--max-follows', type=int, default=50)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Показатель степенного распределения '
+                                 'популярности авторов.')
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        Faker.seed(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.batch_size = options['batch_size']
+
+        user_ids = self.create_users(options['users'])
+        group_ids = self.create_groups(options['groups'])
+        # Популярные авторы и пишут больше, и собирают больше подписчиков.
+        authors = user_ids[:]
+        self.rng.shuffle(authors)
+        weights = power_law_weights(len(authors), options['alpha'])
+        post_ids = self.create_posts(options['posts'], authors, weights,
+                                     group_ids, options['image_ratio'],
+                                     options['days'])
+        comments = self.create_comments(options['comments'], post_ids,
+                                        user_ids)
+        follows = self.create_follows(user_ids, authors, weights,
+                                      options['max_follows'])
+        self.rebuild(user_ids, post_ids, follows)
+        self.stdout.write(
+            f'Создано: пользователей {len(user_ids)}, групп {len(group_ids)}, '
+            f'постов {len(post_ids)}, комментариев {comments}, '
+            f'подписок {len(follows)}.')
+
+    def bulk(self, model, objects):
+        start = last_id(model)
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        return new_ids(model, start, self.batch_size)
+
+    def create_users(self, count):
+        password = make_password(None)
+        start = last_id(User)
+        return self.bulk(User, [
+            User(username=f'{self.faker.user_name()}_{start + number}',
+                 first_name=self.faker.first_name(),
+                 last_name=self.faker.last_name(),
+                 password=password)
+            for number in range(count)
+        ])
+
+    def create_groups(self, count):
+        start = last_id(Group)
+        return self.bulk(Group, [
+            Group(title=f'{self.faker.word().capitalize()} {start + number}',
+                  slug=f'group-{start + number}',
+                  description=self.faker.sentence())
+            for number in range(count)
+        ])
+
+    def create_images(self):
+        """Несколько картинок разных пропорций, общих для всех постов."""
+        images = []
+        for number, size in enumerate(IMAGE_SIZES):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', size, color).save(buffer, 'PNG')
+            name = default_storage.save(f'posts/seed_{number}.png',
+                                        ContentFile(buffer.getvalue()))
+            images.append((name, size))
+        return images
+
+    def create_posts(self, count, authors, weights, group_ids, image_ratio,
+                     days):
+        images = self.create_images() if image_ratio else []
+        posts = []
+        for author_id in self.rng.choices(authors, weights, k=count):
+            post = Post(author_id=author_id, text=self.faker.text(400),
+                        group_id=(self.rng.choice(group_ids)
+                                  if group_ids and self.rng.random() < 0.7
+                                  else None))
+            if images and self.rng.random() < image_ratio:
+                post.image, (post.image_width, post.image_height) = (
+                    self.rng.choice(images))
+            posts.append(post)
+        post_ids = self.bulk(Post, posts)
+        # auto_now_add ставит всем текущее время; разносим посты по
+        # последним days дням в порядке создания.
+        now = timezone.now()
+        step = datetime.timedelta(days=days) / max(len(post_ids), 1)
+        Post.objects.bulk_update([
+            Post(pk=pk, pub_date=now - step * (len(post_ids) - position))
+            for position, pk in enumerate(post_ids)
+        ], ['pub_date'], batch_size=self.batch_size)
+        return post_ids
+
+    def create_comments(self, count, post_ids, user_ids):
+        if not post_ids:
+            return 0
+        Comment.objects.bulk_create([
+            Comment(post_id=self.rng.choice(post_ids),
+                    author_id=self.rng.choice(user_ids),
+                    text=self.faker.sentence())
+            for _ in range(count)
+        ], batch_size=self.batch_size)
+        return count
+
+    def create_follows(self, user_ids, authors, weights, max_follows):
+        pairs = []
+        for user_id in user_ids:
+            wanted = min(int(self.rng.paretovariate(1.2)), max_follows,
+                         len(authors) - 1)
+            followed = set()
+            while len(followed) < wanted:
+                author_id = self.rng.choices(authors, weights)[0]
+                if author_id != user_id:
+                    followed.add(author_id)
+            pairs.extend((user_id, author_id) for author_id in followed)
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs],
+            batch_size=self.batch_size, ignore_conflicts=True)
+        return pairs
+
+    def rebuild(self, user_ids, post_ids, follows):
+        """bulk_create не шлет сигналов: пересчитываем производные данные."""
+        for start in range(0, len(user_ids), self.batch_size):
+            counters.recount_authors(user_ids[start:start + self.batch_size])
+        for start in range(0, len(post_ids), self.batch_size):
+            ids = post_ids[start:start + self.batch_size]
+            counters.recount_posts(ids)
+            search.index(Post.objects.filter(pk__in=ids)
+                         .values_list('id', 'text'))
+        popular = set(AuthorCounters.objects.filter(
+            follower_count__gte=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('user_id', flat=True))
+        for user_id, author_id in follows:
+            if author_id not in popular:
+                timeline.backfill(user_id, author_id)
+        cache.clear()
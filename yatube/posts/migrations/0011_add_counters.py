@@ -0,0 +1,52 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    """Счетчики всех авторов и постов двумя запросами."""
+    quote = schema_editor.quote_name
+    users = quote(apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table)
+    schema_editor.execute(
+        'INSERT INTO posts_authorcounters '
+        '(user_id, post_count, follower_count, following_count) '
+        f'SELECT {users}.id, '
+        '(SELECT COUNT(*) FROM posts_post '
+        f'WHERE posts_post.author_id = {users}.id), '
+        '(SELECT COUNT(*) FROM posts_follow '
+        f'WHERE posts_follow.author_id = {users}.id), '
+        '(SELECT COUNT(*) FROM posts_follow '
+        f'WHERE posts_follow.user_id = {users}.id) '
+        f'FROM {users}')
+    schema_editor.execute(
+        'UPDATE posts_post SET comment_count = '
+        '(SELECT COUNT(*) FROM posts_comment '
+        'WHERE posts_comment.post_id = posts_post.id)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_add_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('post_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('follower_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:20
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorCounters = apps.get_model('posts', 'AuthorCounters')
+    duplicates = (Follow.objects.values('user_id', 'author_id')
+                  .annotate(first=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    for row in duplicates:
+        (Follow.objects.filter(user_id=row['user_id'],
+                               author_id=row['author_id'])
+         .exclude(id=row['first']).delete())
+        AuthorCounters.objects.filter(user_id=row['author_id']).update(
+            follower_count=Follow.objects.filter(
+                author_id=row['author_id']).count())
+        AuthorCounters.objects.filter(user_id=row['user_id']).update(
+            following_count=Follow.objects.filter(
+                user_id=row['user_id']).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_add_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created', 'id'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'], name='follow_author_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_date_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_follows,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
@@ -0,0 +1,135 @@
+import re
+
+from django.db import migrations
+
+# Копия поискового индекса на момент миграции: posts.search может
+# меняться, а историческая миграция — нет.
+FTS_TABLE = 'posts_post_fts'
+PG_INDEX = 'post_text_search_idx'
+
+WORD = re.compile(r'\w+')
+VOWELS = 'аеиоуыэюя'
+
+# Окончания русского стеммера Snowball. Первая группа в каждой паре
+# отрезается, только если перед ней стоит «а» или «я».
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'),
+                     ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый',
+                  'ой', 'ем', 'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому',
+                  'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+         'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+        ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+         'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+         'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи',
+             'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием',
+             'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию',
+             'ью', 'ю', 'ия', 'ья', 'я'))
+DERIVATIONAL = ('ост', 'ость')
+
+
+def _strip(word, endings):
+    """Отрезает самое длинное окончание; None, если отрезать нечего."""
+    matched = [(ending, group) for group, variants in enumerate(endings)
+               for ending in variants if word.endswith(ending)]
+    if not matched:
+        return None
+    ending, group = max(matched, key=lambda item: len(item[0]))
+    rest = word[:-len(ending)]
+    if group == 0 and not rest.endswith(('а', 'я')):
+        return None
+    return rest
+
+
+def _region(word, start=0):
+    """Начало области после первой пары «гласная, согласная»."""
+    for position in range(start + 1, len(word)):
+        if word[position] not in VOWELS and word[position - 1] in VOWELS:
+            return position + 1
+    return len(word)
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Snowball; прочие слова как есть."""
+    word = word.lower().replace('ё', 'е')
+    rv = next((position + 1 for position, letter in enumerate(word)
+               if letter in VOWELS), len(word))
+    if rv == len(word):
+        return word
+    r2 = _region(word, _region(word))
+    prefix, rest = word[:rv], word[rv:]
+    r2 = max(r2 - rv, 0)
+
+    stripped = _strip(rest, PERFECTIVE_GERUND)
+    if stripped is None:
+        rest = _strip(rest, REFLEXIVE) or rest
+        stripped = _strip(rest, ADJECTIVE)
+        if stripped is not None:
+            stripped = _strip(stripped, PARTICIPLE) or stripped
+        else:
+            stripped = _strip(rest, VERB)
+            if stripped is None:
+                stripped = _strip(rest, NOUN)
+    if stripped is not None:
+        rest = stripped
+    if rest.endswith('и'):
+        rest = rest[:-1]
+    for ending in DERIVATIONAL:
+        if rest.endswith(ending) and len(rest) - len(ending) >= r2:
+            rest = rest[:-len(ending)]
+            break
+    if rest.endswith('нн'):
+        rest = rest[:-1]
+    elif rest.endswith(('ейше', 'ейш')):
+        rest = rest[:rest.rindex('ейш')]
+        if rest.endswith('нн'):
+            rest = rest[:-1]
+    elif rest.endswith('ь'):
+        rest = rest[:-1]
+    return prefix + rest
+
+
+def terms(text):
+    return [stem(word) for word in WORD.findall(text.lower())]
+
+
+def create_index(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON posts_post '
+            "USING gin (to_tsvector('russian', text))")
+    if connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+        "USING fts5(text, tokenize='porter unicode61')")
+    rows = [(pk, ' '.join(terms(text))) for pk, text in
+            Post.objects.using(connection.alias).values_list('id', 'text')
+            .iterator()]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows)
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_add_uploads'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -24,6 +24,7 @@ class Post(models.Model):
 
     text = models.TextField('Текст поста', help_text='Текст нового поста')
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='posts', verbose_name='Автор')
     group = models.ForeignKey(
@@ -34,11 +35,24 @@ class Post(models.Model):
         help_text='Группа, к которой будет относиться пост')
     image = models.ImageField('Картинка', upload_to='posts/',
                               blank=True)
+    image_width = models.PositiveIntegerField('Ширина картинки', null=True,
+                                              blank=True, editable=False)
+    image_height = models.PositiveIntegerField('Высота картинки', null=True,
+                                               blank=True, editable=False)
+    comment_count = models.PositiveIntegerField('Комментариев', default=0)
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -53,6 +67,12 @@ class Comment(models.Model):
     text = models.TextField('Текст комментария', help_text='Текст комментария')
     created = models.DateTimeField('Дата комментария', auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     """Подписка на авторов."""
@@ -60,3 +80,59 @@ class Follow(models.Model):
                              related_name='follower', verbose_name='Подписчик')
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='following', verbose_name='Автор')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class AuthorCounters(models.Model):
+    """Денормализованные счетчики автора."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='counters',
+                                verbose_name='Автор')
+    post_count = models.PositiveIntegerField('Постов', default=0)
+    follower_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок пользователя."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline', verbose_name='Читатель')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='timeline_entries',
+                             verbose_name='Пост')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_post'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_date_idx'),
+        ]
+
+
+class Upload(models.Model):
+    """Картинка, загружаемая по частям до отправки формы поста."""
+    token = models.CharField('Токен', max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='uploads', verbose_name='Автор')
+    filename = models.CharField('Имя файла', max_length=255)
+    size = models.PositiveIntegerField('Размер')
+    offset = models.PositiveIntegerField('Загружено', default=0)
+    sha256 = models.CharField('SHA-256', max_length=64, blank=True)
+    created = models.DateTimeField('Дата начала', auto_now_add=True)
+
+    @property
+    def complete(self):
+        return self.offset == self.size
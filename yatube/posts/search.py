@@ -0,0 +1,184 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'posts_post_fts'
+PG_INDEX = 'post_text_search_idx'
+MAX_TERMS = 8
+
+WORD = re.compile(r'\w+')
+VOWELS = 'аеиоуыэюя'
+
+# Окончания русского стеммера Snowball. Первая группа в каждой паре
+# отрезается, только если перед ней стоит «а» или «я».
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'),
+                     ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый',
+                  'ой', 'ем', 'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому',
+                  'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+         'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+        ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+         'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+         'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи',
+             'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием',
+             'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию',
+             'ью', 'ю', 'ия', 'ья', 'я'))
+DERIVATIONAL = ('ост', 'ость')
+
+
+def _strip(word, endings):
+    """Отрезает самое длинное окончание; None, если отрезать нечего."""
+    matched = [(ending, group) for group, variants in enumerate(endings)
+               for ending in variants if word.endswith(ending)]
+    if not matched:
+        return None
+    ending, group = max(matched, key=lambda item: len(item[0]))
+    rest = word[:-len(ending)]
+    if group == 0 and not rest.endswith(('а', 'я')):
+        return None
+    return rest
+
+
+def _region(word, start=0):
+    """Начало области после первой пары «гласная, согласная»."""
+    for position in range(start + 1, len(word)):
+        if word[position] not in VOWELS and word[position - 1] in VOWELS:
+            return position + 1
+    return len(word)
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Snowball; прочие слова как есть."""
+    word = word.lower().replace('ё', 'е')
+    rv = next((position + 1 for position, letter in enumerate(word)
+               if letter in VOWELS), len(word))
+    if rv == len(word):
+        return word
+    r2 = _region(word, _region(word))
+    prefix, rest = word[:rv], word[rv:]
+    r2 = max(r2 - rv, 0)
+
+    stripped = _strip(rest, PERFECTIVE_GERUND)
+    if stripped is None:
+        rest = _strip(rest, REFLEXIVE) or rest
+        stripped = _strip(rest, ADJECTIVE)
+        if stripped is not None:
+            stripped = _strip(stripped, PARTICIPLE) or stripped
+        else:
+            stripped = _strip(rest, VERB)
+            if stripped is None:
+                stripped = _strip(rest, NOUN)
+    if stripped is not None:
+        rest = stripped
+    if rest.endswith('и'):
+        rest = rest[:-1]
+    for ending in DERIVATIONAL:
+        if rest.endswith(ending) and len(rest) - len(ending) >= r2:
+            rest = rest[:-len(ending)]
+            break
+    if rest.endswith('нн'):
+        rest = rest[:-1]
+    elif rest.endswith(('ейше', 'ейш')):
+        rest = rest[:rest.rindex('ейш')]
+        if rest.endswith('нн'):
+            rest = rest[:-1]
+    elif rest.endswith('ь'):
+        rest = rest[:-1]
+    return prefix + rest
+
+
+def terms(text):
+    return [stem(word) for word in WORD.findall(text.lower())]
+
+
+def install(conn=connection):
+    """Создает поисковый индекс для текущей СУБД."""
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                "USING fts5(text, tokenize='porter unicode61')")
+        elif conn.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON posts_post '
+                "USING gin (to_tsvector('russian', text))")
+
+
+def uninstall(conn=connection):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif conn.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+def index(rows, conn=connection):
+    """Индексирует пары (id, текст). Postgres индексирует выражение сам."""
+    rows = [(pk, ' '.join(terms(text))) for pk, text in rows]
+    if conn.vendor != 'sqlite' or not rows:
+        return
+    with conn.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [(pk,) for pk, _ in rows])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows)
+
+
+def remove(ids, conn=connection):
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [(pk,) for pk in ids])
+
+
+def prune(conn=connection):
+    """Удаляет из индекса посты, которых больше нет."""
+    if conn.vendor == 'sqlite':
+        with conn.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid NOT IN '
+                           '(SELECT id FROM posts_post)')
+
+
+def clear(conn=connection):
+    if conn.vendor == 'sqlite':
+        with conn.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+
+def match_query(text):
+    """Запрос FTS5: все основы слов, каждая в кавычках."""
+    return ' '.join(f'"{term}"' for term in terms(text)[:MAX_TERMS])
+
+
+def ranked(queryset, text):
+    """Посты, подходящие под запрос, с релевантностью в поле rank.
+
+    Возвращает queryset и порядок сортировки для CursorPaginator.
+    """
+    conn = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if conn.vendor == 'postgresql' and text.strip():
+        query = "plainto_tsquery('russian', %s)"
+        vector = f"to_tsvector('russian', {table}.text)"
+        return queryset.annotate(
+            rank=RawSQL(f'ts_rank({vector}, {query})', [text],
+                        output_field=FloatField()),
+        ).extra(where=[f'{vector} @@ {query}'],
+                params=[text]), ('-rank', '-id')
+    query = match_query(text)
+    if conn.vendor != 'sqlite' or not query:
+        return queryset.none(), ('-id',)
+    return queryset.annotate(rank=RawSQL(
+        f'SELECT bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id', [query],
+        output_field=FloatField(),
+    )).extra(where=[f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+                    f'WHERE {FTS_TABLE} MATCH %s)'],
+             params=[query]), ('rank', '-id')
@@ -0,0 +1,119 @@
+import threading
+
+from django.db import connections
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from core import cache
+from . import counters, feeds, search, timeline
+from .models import Comment, Follow, Group, Post
+
+# Посты, которые сейчас удаляются вместе с комментариями.
+_deleting = threading.local()
+
+
+def bump_post_feeds(post_id):
+    post = (Post.objects.filter(pk=post_id)
+            .values('author_id', 'group_id').first())
+    if post is not None:
+        cache.bump(*feeds.for_post(post['author_id'], post['group_id'],
+                                   post_id))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    """Пост, перенесенный в другую группу, пропадает из старой ленты."""
+    if instance.pk and not raw:
+        old_group = (Post.objects.filter(pk=instance.pk)
+                     .values_list('group_id', flat=True).first())
+        if old_group is not None and old_group != instance.group_id:
+            cache.bump(feeds.group(old_group))
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, using='default',
+               **kwargs):
+    """Новый пост попадает в ленты подписчиков, счетчик автора и поиск."""
+    search.index([(instance.pk, instance.text)], connections[using])
+    if raw:
+        return
+    if created:
+        counters.bump_author(instance.author_id, post_count=1)
+        timeline.fan_out(instance)
+    cache.bump(*feeds.for_post(instance.author_id, instance.group_id,
+                               instance.pk))
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    """Комментарии удаляемого поста не трогают его счетчик и ленты."""
+    _deleting.__dict__.setdefault('ids', set()).add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, using='default', **kwargs):
+    _deleting.__dict__.get('ids', set()).discard(instance.pk)
+    search.remove([instance.pk], connections[using])
+    counters.bump_author(instance.author_id, post_count=-1)
+    cache.bump(*feeds.for_post(instance.author_id, instance.group_id,
+                               instance.pk))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_comments(instance.post_id, 1)
+        bump_post_feeds(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in _deleting.__dict__.get('ids', ()):
+        return
+    counters.bump_comments(instance.post_id, -1)
+    bump_post_feeds(instance.post_id)
+
+
+def bump_group_feeds(group):
+    authors = (Post.objects.filter(group=group).order_by()
+               .values_list('author_id', flat=True).distinct())
+    cache.bump(feeds.INDEX, feeds.group(group.pk),
+               *[feeds.profile(author_id) for author_id in authors])
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    """Карточки показывают название и ссылку на группу."""
+    if not created and not raw:
+        bump_group_feeds(instance)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    bump_group_feeds(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    """Подписка заполняет ленту последними постами автора."""
+    if created and not raw:
+        counters.bump_author(instance.author_id, follower_count=1)
+        counters.bump_author(instance.user_id, following_count=1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        cache.bump(feeds.follows(instance.author_id),
+                   feeds.follows(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """Отписка убирает посты автора из ленты.
+
+    Автор, опустившийся ниже порога, снова раскладывает посты по лентам.
+    """
+    counters.bump_author(instance.author_id, follower_count=-1)
+    counters.bump_author(instance.user_id, following_count=-1)
+    timeline.trim(instance.user_id, instance.author_id)
+    timeline.unfollowed(instance.author_id)
+    cache.bump(feeds.follows(instance.author_id),
+               feeds.follows(instance.user_id))
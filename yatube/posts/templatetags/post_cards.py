@@ -0,0 +1,54 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from posts import thumbnails
+
+register = template.Library()
+
+TEMPLATE = 'includes/post_card.html'
+
+
+def card_key(post, view_name):
+    """Ключ карточки: меняется при правке поста, смене группы и счетчика.
+
+    view_name входит в ключ, потому что в профиле и группе карточка
+    прячет ссылку на саму себя. Название и адрес группы входят в ключ
+    отпечатком: переименование группы не трогает ее посты.
+    """
+    group = (f'{post.group.slug}:{post.group.title}'
+             if post.group_id else '')
+    return (f'post_card:{view_name}:{post.pk}:'
+            f'{post.updated_at.timestamp()}:{post.group_id}:'
+            f'{hashlib.md5(group.encode()).hexdigest()[:8]}:'
+            f'{post.comment_count}')
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """HTML карточек постов: готовые одним get_many, остальные рендерятся.
+
+    Миниатюры для перерисовываемых карточек тоже ищутся все сразу.
+
+    {% post_cards page_obj as cards %}
+    """
+    posts = list(posts)
+    match = getattr(context.get('request'), 'resolver_match', None)
+    view_name = match.view_name if match else ''
+    keys = [card_key(post, view_name) for post in posts]
+    cards = cache.get_many(keys)
+    stale = [(key, post) for key, post in zip(keys, posts)
+             if key not in cards]
+    images = thumbnails.cached_images([post.image for _, post in stale])
+    card_template = context.template.engine.get_template(TEMPLATE)
+    missing = {}
+    for key, post in stale:
+        with context.push(post=post, thumbnails=images):
+            missing[key] = card_template.render(context)
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
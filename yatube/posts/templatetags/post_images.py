@@ -0,0 +1,17 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_image(context, image):
+    """Миниатюра со srcset или None, если она еще создается.
+
+    Ленты кладут в контекст thumbnails, найденные сразу для всей страницы.
+    """
+    resolved = context.get('thumbnails')
+    if image and resolved is not None and image.name in resolved:
+        return resolved[image.name]
+    return thumbnails.cached_image(image)
@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.core.cache import cache
+
+from posts.models import Comment, Group, Post, Follow
+
+User = get_user_model()
+
+
+class PostAPITests(TestCase):
+    """JSON API отдает те же ленты, что и страницы."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for number in range(settings.POSTS_PER_PAGE + 3):
+            cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                           text=f'Пост номер {number}')
+        Comment.objects.create(post=cls.post, author=cls.user,
+                               text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_post_list_cursor_pages(self):
+        """Вторая страница по ссылке next продолжает первую."""
+        response = self.guest_client.get(reverse('api:post_list'))
+        first = response.json()
+        second = self.guest_client.get(first['next']).json()
+
+        self.assertEqual(len(first['results']), settings.POSTS_PER_PAGE)
+        self.assertEqual(first['results'][0]['id'], self.post.id)
+        self.assertEqual(first['results'][0]['author'], 'author')
+        self.assertEqual(first['results'][0]['group'], 'test')
+        self.assertEqual(len(second['results']), 3)
+        self.assertIsNone(second['next'])
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_sparse_fields(self):
+        """?fields= оставляет только нужные поля и сохраняется в next."""
+        response = self.guest_client.get(reverse('api:post_list'),
+                                         {'fields': 'id,author'})
+        data = response.json()
+
+        self.assertEqual(list(data['results'][0]), ['id', 'author'])
+        self.assertIn('fields=id%2Cauthor', data['next'])
+        self.assertEqual(self.guest_client.get(
+            reverse('api:post_list'), {'fields': 'id,secret'}).status_code,
+            400)
+
+    def test_post_list_cached_until_new_post(self):
+        """Страница ленты берется из кэша до появления нового поста."""
+        url = reverse('api:group_posts', kwargs={'slug': self.group.slug})
+        self.guest_client.get(url)
+
+        with self.assertNumQueries(1):
+            self.guest_client.get(url)
+        post = Post.objects.create(author=self.author, group=self.group,
+                                   text='Свежий пост')
+        response = self.guest_client.get(url)
+
+        self.assertEqual(response.json()['results'][0]['id'], post.id)
+
+    def test_details(self):
+        """Пост, группа и профиль отдаются отдельными ресурсами."""
+        cases = {
+            reverse('api:post_detail', kwargs={'post_id': self.post.id}):
+                {'id': self.post.id, 'comment_count': 1},
+            reverse('api:group_detail', kwargs={'slug': 'test'}):
+                {'slug': 'test', 'title': 'Тестовая группа'},
+            reverse('api:profile_detail', kwargs={'username': 'author'}):
+                {'username': 'author', 'post_count': 13,
+                 'follower_count': 1},
+        }
+
+        for url, expected in cases.items():
+            with self.subTest(url=url):
+                data = self.guest_client.get(url).json()
+
+                self.assertEqual(
+                    {key: data[key] for key in expected}, expected)
+
+    def test_comments(self):
+        """Комментарии читают все, а пишут только вошедшие."""
+        url = reverse('api:post_comments', kwargs={'post_id': self.post.id})
+
+        guest = self.guest_client.post(url, {'text': 'Гость'})
+        created = self.authorized_client.post(url, {'text': 'Новый'})
+        invalid = self.authorized_client.post(url, {'text': ''})
+        comments = self.guest_client.get(url).json()['results']
+
+        self.assertEqual(guest.status_code, 401)
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(created.json()['author'], 'auth')
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual([comment['text'] for comment in comments],
+                         ['Комментарий', 'Новый'])
+
+    def test_follow_feed(self):
+        """Лента подписок только для вошедших и не кэшируется прокси."""
+        url = reverse('api:follow_feed')
+
+        response = self.authorized_client.get(url, {'fields': 'id'})
+
+        self.assertEqual(self.guest_client.get(url).status_code, 401)
+        self.assertEqual(response.json()['results'][0], {'id': self.post.id})
+        self.assertIn('private', response['Cache-Control'])
@@ -0,0 +1,388 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import (Client, RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from django.core.cache import cache
+
+from core import cache as cache_module
+from core.middleware import AnonymousPageCacheMiddleware
+from posts import feeds
+from posts.models import Comment, Group, Post, Follow
+from posts.tests.utils import SearchIndexMixin
+
+User = get_user_model()
+
+
+class PostViewConditionalTests(TestCase):
+    """Повторный визит без изменений получает 304 без рендера."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Тестовый пост')
+        cls.urls = {
+            'post_detail': reverse('posts:post_detail',
+                                   kwargs={'post_id': cls.post.id}),
+            'group_list': reverse('posts:group_list',
+                                  kwargs={'slug': cls.group.slug}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': cls.author.username}),
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def revisit(self, client, url):
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_not_modified(self):
+        """Страница без изменений отдается как 304 без шаблонов."""
+        for name, url in self.urls.items():
+            with self.subTest(name=name):
+                response = self.revisit(self.guest_client, url)
+
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.templates, [])
+
+    def test_changes_modify_pages(self):
+        """Новый комментарий или пост меняют ETag своих страниц."""
+        etags = {name: self.guest_client.get(url)['ETag']
+                 for name, url in self.urls.items()}
+
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Еще один пост')
+
+        for name, url in self.urls.items():
+            with self.subTest(name=name):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[name])
+
+                self.assertEqual(response.status_code, 200)
+
+    def test_other_posts_keep_post_detail(self):
+        """Чужой пост на главной не сбрасывает ETag страницы поста."""
+        url = self.urls['post_detail']
+        etag = self.guest_client.get(url)['ETag']
+
+        Post.objects.create(author=self.user, text='Пост другого автора')
+
+        self.assertEqual(self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_etag_depends_on_user(self):
+        """Автор видит кнопку редактирования, читатель — нет."""
+        url = self.urls['post_detail']
+        etag = self.author_client.get(url)['ETag']
+
+        self.assertEqual(self.authorized_client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_follow_modifies_profile(self):
+        """Подписка меняет кнопку и счетчики в профиле."""
+        url = self.urls['profile']
+        etag = self.authorized_client.get(url)['ETag']
+
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'author'}))
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Отписаться')
+
+
+class PostCardCacheTests(TestCase):
+    """Карточки постов кэшируются по отдельности."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание')
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other',
+            description='Другое описание')
+        for number in range(3):
+            Post.objects.create(author=cls.user, group=cls.group,
+                                text=f'Пост группы {number}')
+        cls.post = Post.objects.create(author=cls.user,
+                                       group=cls.other_group,
+                                       text='Пост другой группы')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def rendered_cards(self, url=None):
+        """Сколько карточек пришлось рендерить, минуя кэш страницы."""
+        cache_module.bump(feeds.INDEX)
+        response = self.guest_client.get(url or reverse('posts:index'))
+        return [template.name for template in response.templates
+                ].count('includes/post_card.html')
+
+    def test_cards_cached(self):
+        """Повторный рендер ленты берет все карточки из кэша."""
+        self.assertEqual(self.rendered_cards(), 4)
+        self.assertEqual(self.rendered_cards(), 0)
+
+    def test_cards_depend_on_view(self):
+        """В профиле карточка без ссылки на профиль рендерится заново."""
+        self.rendered_cards()
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': 'auth'}))
+
+        self.assertNotContains(response, 'все посты пользователя')
+
+    def test_edit_invalidates_only_its_card(self):
+        """Правка поста перерисовывает только его карточку."""
+        self.rendered_cards()
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост'
+        post.save()
+
+        self.assertEqual(self.rendered_cards(), 1)
+
+    def test_group_rename_invalidates_group_cards(self):
+        """Переименование группы перерисовывает только ее посты."""
+        self.rendered_cards()
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.save()
+
+        self.assertEqual(self.rendered_cards(), 3)
+
+    def test_group_rename_keeps_post_dates(self):
+        """Переименование группы не меняет дату изменения ее постов."""
+        self.rendered_cards()
+        dates = list(Post.objects.order_by('pk')
+                     .values_list('updated_at', flat=True))
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed'
+        group.save()
+
+        self.assertEqual(list(Post.objects.order_by('pk')
+                              .values_list('updated_at', flat=True)), dates)
+        self.assertEqual(self.rendered_cards(), 3)
+
+
+class AnonymousPageCacheTests(TestCase):
+    """Гости получают готовые страницы, пока не изменятся их ленты."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание')
+        cls.post = Post.objects.create(author=cls.user, group=cls.group,
+                                       text='Тестовый пост')
+        cls.urls = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list',
+                             kwargs={'slug': cls.group.slug}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': cls.user.username}),
+            'detail': reverse('posts:post_detail',
+                              kwargs={'post_id': cls.post.pk}),
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_pages_served_from_cache(self):
+        """Повторный запрос гостя не доходит до view и базы."""
+        for name, url in self.urls.items():
+            with self.subTest(name=name):
+                response = self.guest_client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'miss')
+                with self.assertNumQueries(0):
+                    cached = self.guest_client.get(url)
+                self.assertEqual(cached['X-Page-Cache'], 'hit')
+                self.assertEqual(cached.content, response.content)
+                self.assertEqual(cached['Content-Type'],
+                                 response['Content-Type'])
+
+    def test_query_string_is_part_of_key(self):
+        self.guest_client.get(self.urls['index'])
+        response = self.guest_client.get(self.urls['index'] + '?page=1')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_session_bypasses_cache(self):
+        """С кукой сессии страница всегда рендерится заново."""
+        self.guest_client.get(self.urls['index'])
+        response = self.authorized_client.get(self.urls['index'])
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertContains(response, self.reader.username)
+
+    def test_uncached_views_not_stored(self):
+        """Страницы без cache_for_anonymous в кэш не попадают."""
+        url = reverse('posts:search') + '?q=пост'
+        self.guest_client.get(url)
+        self.assertEqual(self.guest_client.get(url)['X-Page-Cache'], 'miss')
+
+    def test_not_found_not_stored(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': 404})
+        self.guest_client.get(url)
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_etag_answered_from_cache(self):
+        response = self.guest_client.get(self.urls['detail'])
+        cached = self.guest_client.get(
+            self.urls['detail'], HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_proxy_headers(self):
+        """Прокси хранит страницу гостя и сбросит ее по ключам лент."""
+        response = self.guest_client.get(self.urls['detail'])
+        self.assertEqual(
+            response['Surrogate-Key'].split(),
+            sorted([feeds.profile(self.user.pk), feeds.group(self.group.pk),
+                    feeds.post(self.post.pk)]))
+        self.assertIn(f's-maxage={settings.PROXY_MAX_AGE}',
+                      response['Cache-Control'])
+        cached = self.guest_client.get(self.urls['detail'])
+        self.assertEqual(cached['Surrogate-Key'], response['Surrogate-Key'])
+
+    def test_no_proxy_headers_for_session(self):
+        response = self.authorized_client.get(self.urls['detail'])
+        self.assertFalse(response.has_header('Surrogate-Key'))
+        self.assertNotIn('s-maxage', response.get('Cache-Control', ''))
+
+    def test_stale_page_while_rebuilding(self):
+        """Пока другой воркер пересобирает страницу, гость видит старую."""
+        url = self.urls['index']
+        self.guest_client.get(url)
+        cache_module.bump(feeds.INDEX)
+        key = AnonymousPageCacheMiddleware(None).key(
+            RequestFactory().get(url))
+        self.assertTrue(cache_module.lock(key))
+
+        response = self.guest_client.get(url)
+
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertIn('s-maxage=0', response['Cache-Control'])
+        cache_module.unlock(key)
+        self.assertEqual(self.guest_client.get(url)['X-Page-Cache'], 'miss')
+
+    def test_stale_fragment_per_feed(self):
+        """Пока лента группы пересобирается, гость не видит чужую группу."""
+        other = Group.objects.create(title='Другая группа', slug='other')
+        Post.objects.create(author=self.user, group=other,
+                            text='Пост другой группы')
+        self.guest_client.get(self.urls['group'])
+        self.guest_client.get(reverse('posts:group_list',
+                                      kwargs={'slug': other.slug}))
+        name = feeds.group(self.group.pk)
+        cache_module.bump(name)
+        key = cache_module.versioned_key('template.cache.group_page',
+                                         [name], '')
+        self.assertTrue(cache_module.lock(key))
+
+        response = self.guest_client.get(self.urls['group'])
+
+        self.assertContains(response, 'Тестовый пост')
+        self.assertNotContains(response, 'Пост другой группы')
+        cache_module.unlock(key)
+
+    def assertInvalidated(self, names, change):
+        for name in names:
+            self.guest_client.get(self.urls[name])
+        change()
+        for name in names:
+            with self.subTest(name=name):
+                response = self.guest_client.get(self.urls[name])
+                self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_new_post_invalidates(self):
+        self.assertInvalidated(
+            ['index', 'group', 'profile', 'detail'],
+            lambda: Post.objects.create(author=self.user, group=self.group,
+                                        text='Новый пост'))
+
+    def test_comment_invalidates(self):
+        self.assertInvalidated(
+            ['index', 'detail'],
+            lambda: Comment.objects.create(post=self.post, author=self.reader,
+                                           text='Комментарий'))
+
+    def test_follow_invalidates(self):
+        """Подписка меняет счетчики в профиле."""
+        self.assertInvalidated(
+            ['profile'],
+            lambda: Follow.objects.create(user=self.reader,
+                                          author=self.user))
+
+    def test_unrelated_changes_keep_post_detail(self):
+        """Подписки и чужие посты страницу поста не сбрасывают."""
+        self.guest_client.get(self.urls['detail'])
+
+        Follow.objects.create(user=self.reader, author=self.user)
+        Post.objects.create(author=self.reader, text='Чужой пост')
+
+        response = self.guest_client.get(self.urls['detail'])
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+
+
+@override_settings(PURGE_URLS=['http://proxy/'])
+class ProxyPurgeTests(SearchIndexMixin, TransactionTestCase):
+    """Изменения сбрасывают у прокси страницы с ключами своих лент."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='test')
+        self.post = Post.objects.create(author=self.user, group=self.group,
+                                        text='Тестовый пост')
+        patcher = mock.patch('core.purge.send')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def purged(self):
+        return set().union(*[call.args[0]
+                             for call in self.send.call_args_list])
+
+    def test_post_purges_feeds(self):
+        Post.objects.create(author=self.user, group=self.group, text='Новый')
+        self.assertTrue({feeds.INDEX, feeds.profile(self.user.pk),
+                         feeds.group(self.group.pk)} <= self.purged())
+
+    def test_comment_purges_post(self):
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        self.assertIn(feeds.post(self.post.pk), self.purged())
+
+    def test_follow_purges_both_users(self):
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertTrue({feeds.follows(self.user.pk),
+                         feeds.follows(self.reader.pk)} <= self.purged())
@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import (LiveServerTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+
+from posts import benchmarks
+from posts.models import Comment
+from posts.tests.utils import SearchIndexMixin
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class LoadTestCommandTests(SearchIndexMixin, TransactionTestCase):
+    """Нагрузочный прогон проходит по всем маршрутам posts."""
+
+    def run_loadtest(self, **options):
+        call_command('seed', users=10, groups=2, posts=20, comments=10,
+                     image_ratio=0, stdout=StringIO())
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        output = os.path.join(directory, 'run.json')
+
+        with override_settings(CHUNKED_UPLOAD_DIR=directory):
+            call_command('loadtest', requests=60, concurrency=1,
+                         logged_in=1, output=output, stdout=StringIO(),
+                         **options)
+        with open(output) as file:
+            report = json.load(file)
+        shutil.rmtree(directory, ignore_errors=True)
+        return report
+
+    def test_loadtest_covers_routes(self):
+        """Отчет сохраняется в JSON с перцентилями, ошибок нет."""
+        report = self.run_loadtest()
+
+        self.assertEqual(report['total']['requests'], 60)
+        self.assertEqual(report['total']['errors'], 0)
+        self.assertLessEqual(report['total']['p50_ms'],
+                             report['total']['p99_ms'])
+
+
+class LoadTestHTTPTests(LoadTestCommandTests, LiveServerTestCase):
+    """С --url нагрузка идет настоящими HTTP-запросами к серверу."""
+
+    def test_loadtest_covers_routes(self):
+        report = self.run_loadtest(url=self.live_server_url)
+
+        self.assertEqual(report['options']['url'], self.live_server_url)
+        self.assertEqual(report['total']['requests'], 60)
+        self.assertEqual(report['total']['errors'], 0)
+        # Формы прошли проверку CSRF и сессию вошедшего пользователя.
+        self.assertTrue(Comment.objects.filter(
+            text='Комментарий из нагрузочного теста').exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, **benchmarks.SETTINGS)
+class BenchmarkTests(TestCase):
+    """Микробенчмарки запускаются и ловят замедление."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_run_all_cases(self):
+        """Каждый бенчмарк отрабатывает на маленьком наборе данных."""
+        results = benchmarks.run(number=1, repeat=1, posts=30, comments=5,
+                                 follows=3)
+
+        self.assertEqual(set(results), set(benchmarks.CASES))
+        for row in results.values():
+            self.assertLessEqual(row['min_ms'], row['median_ms'])
+
+    def test_compare_threshold(self):
+        """Регрессия — только замедление больше порога."""
+        baseline = {'fast': {'min_ms': 10}, 'slow': {'min_ms': 10}}
+        results = {'fast': {'min_ms': 12}, 'slow': {'min_ms': 13},
+                   'new': {'min_ms': 100}}
+
+        self.assertEqual(list(benchmarks.compare(results, baseline, 0.25)),
+                         ['slow'])
+
+    def test_compare_noise_floor(self):
+        """Быстрый замер не падает из-за долей миллисекунды."""
+        baseline = {'tiny': {'min_ms': 2}, 'slow': {'min_ms': 10}}
+        results = {'tiny': {'min_ms': 3}, 'slow': {'min_ms': 15}}
+
+        self.assertEqual(
+            list(benchmarks.compare(results, baseline, 0.25, min_delta=2)),
+            ['slow'])
@@ -11,9 +11,17 @@ from posts.models import Group, Post, Comment
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False)
 class PostFormTests(TestCase):
     """Тест view приложения posts."""
 
@@ -31,17 +39,9 @@ class PostFormTests(TestCase):
             text='Тестовый пост',
             group=cls.group
         )
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
         cls.uploaded = SimpleUploadedFile(
             name='small.gif',
-            content=small_gif,
+            content=SMALL_GIF,
             content_type='image/gif'
         )
 
@@ -111,7 +111,9 @@ class PostFormTests(TestCase):
             data=form_fields
         )
 
-        self.assertTrue(Post.objects.filter(image='posts/small.gif').exists())
+        self.assertTrue(Post.objects.filter(image='posts/small.gif',
+                                            image_width=2,
+                                            image_height=1).exists())
         self.assertRedirects(response, reverse(
                              'posts:profile', kwargs={'username': self.user}))
         self.assertEqual(Post.objects.count(), count_posts + 1)
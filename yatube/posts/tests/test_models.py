@@ -1,7 +1,14 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection, models
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from posts.models import Group, Post
+from posts import counters, timeline
+from posts.models import (AuthorCounters, Comment, Follow, Group, Post,
+                          Timeline)
 
 User = get_user_model()
 
@@ -89,3 +96,180 @@ class GroupModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     group._meta.get_field(field).verbose_name, expected_value)
+
+
+class TimelineModelTest(TestCase):
+    """Тесты для материализованной ленты подписок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.old_post = Post.objects.create(author=cls.author,
+                                           text='Старый пост')
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка заполняет ленту, отписка очищает её."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+
+        self.assertEqual(self.feed_ids(), [new_post.id, self.old_post.id])
+
+        follow.delete()
+
+        self.assertFalse(Timeline.objects.filter(user=self.reader).exists())
+
+    def feed_ids(self, size=10):
+        return [post.id for post in timeline.feed(self.reader)[:size]]
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_popular_author_is_merged_on_read(self):
+        """Посты популярного автора подмешиваются при чтении без записи."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=other)
+        posts = [Post.objects.create(author=author, text=f'Пост {number}')
+                 for number in range(5) for author in (self.author, other)]
+        entries = Timeline.objects.count()
+
+        ids = self.feed_ids(20)
+
+        self.assertEqual(ids[:10], [post.id for post in reversed(posts)])
+        self.assertEqual(ids.count(self.old_post.id), 1)
+        self.assertEqual(Timeline.objects.count(), entries)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1, TIMELINE_BACKFILL=2)
+    def test_popular_author_has_no_gap(self):
+        """Постов больше TIMELINE_BACKFILL между чтениями — все в ленте."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.feed_ids()
+        posts = [Post.objects.create(author=self.author, text=f'Пост {n}')
+                 for n in range(5)]
+
+        self.assertEqual(self.feed_ids(6),
+                         [post.id for post in reversed(posts)]
+                         + [self.old_post.id])
+
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_demoted_author_keeps_posts(self):
+        """Посты, написанные в популярности, остаются после ее конца."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        other = User.objects.create_user(username='other')
+        follow = Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пока популярен')
+        self.assertFalse(Timeline.objects.filter(post=post).exists())
+
+        follow.delete()
+
+        self.assertEqual(self.feed_ids(), [post.id, self.old_post.id])
+        self.assertTrue(Timeline.objects.filter(user=self.reader,
+                                                post=post).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_popular_posts_read_with_limit(self):
+        """Посты популярных авторов не читаются целиком."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            list(timeline.feed(self.reader).order_by(*timeline.ORDERING)
+                 .filter(pub_date__lte=self.old_post.pub_date)[:10])
+
+        for query in queries.captured_queries:
+            if '"author_id" IN' in query['sql']:
+                with self.subTest(sql=query['sql']):
+                    self.assertIn('LIMIT', query['sql'])
+
+class CountersModelTest(TestCase):
+    """Тесты денормализованных счетчиков."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def test_counters_follow_changes(self):
+        """Счетчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(author=self.author, text='Второй пост')
+        Comment.objects.create(post=post, author=self.reader,
+                               text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        author = AuthorCounters.objects.get(user=self.author)
+
+        self.assertEqual(author.post_count, 2)
+        self.assertEqual(author.follower_count, 1)
+        self.assertEqual(AuthorCounters.objects.get(
+            user=self.reader).following_count, 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).comment_count, 1)
+
+        follow.delete()
+        post.delete()
+        author.refresh_from_db()
+
+        self.assertEqual(author.post_count, 1)
+        self.assertEqual(author.follower_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount исправляет расхождения."""
+        AuthorCounters.objects.filter(user=self.author).update(post_count=7)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=3)
+
+        call_command('recount', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            AuthorCounters.objects.get(user=self.author).post_count, 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comment_count, 0)
+
+    def test_post_delete_skips_comment_updates(self):
+        """Каскадное удаление комментариев не обновляет удаляемый пост."""
+        def delete_queries(comments):
+            post = Post.objects.create(author=self.author, text='Пост')
+            Comment.objects.bulk_create([
+                Comment(post=post, author=self.reader, text='Комментарий')
+                for _ in range(comments)])
+            with CaptureQueriesContext(connection) as queries:
+                post.delete()
+            return len(queries)
+
+        self.assertEqual(delete_queries(5), delete_queries(1))
+
+    def test_recount_all_queries_per_counter(self):
+        """recount_all не ходит в базу на каждую строку."""
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorCounters.objects.all().delete()
+        Post.objects.update(comment_count=0)
+
+        # Пачка id, вставка, пачка-конец и два UPDATE.
+        with self.assertNumQueries(5):
+            counters.recount_all(batch_size=500)
+
+        author = AuthorCounters.objects.get(user=self.author)
+        self.assertEqual((author.post_count, author.follower_count), (1, 1))
+        self.assertEqual(AuthorCounters.objects.get(
+            user=self.reader).following_count, 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comment_count, 1)
+
+
+class SeedCommandTest(TestCase):
+    """Тесты генератора тестовых данных."""
+
+    def test_seed_builds_consistent_data(self):
+        """seed создает связанные данные и производные к ним."""
+        call_command('seed', users=30, groups=3, posts=60, comments=40,
+                     image_ratio=0, batch_size=7, stdout=StringIO())
+        out = StringIO()
+        call_command('recount', stdout=out)
+
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertEqual(Post.objects.values('pub_date').distinct().count(),
+                         60)
+        self.assertFalse(Follow.objects.filter(
+            user=models.F('author')).exists())
+        self.assertIn('авторов 0, постов 0', out.getvalue())
+        self.assertTrue(Timeline.objects.exists())
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import uploads
+from posts.models import Post, Upload
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False,
+                   CHUNKED_UPLOAD_DIR=os.path.join(TEMP_MEDIA_ROOT, 'chunks'),
+                   UPLOAD_CHUNK_SIZE=25)
+class ChunkedUploadTests(TestCase):
+    """Тест загрузки картинки по частям."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        """Создаем авторизованного пользователя."""
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def start(self, filename='small.gif'):
+        response = self.authorized_client.post(
+            reverse('posts:upload_start'),
+            data={'filename': filename, 'size': len(SMALL_GIF)})
+        return response
+
+    def send(self, token, offset, chunk):
+        return self.authorized_client.patch(
+            reverse('posts:upload_chunk', kwargs={'token': token}),
+            data=chunk, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_upload_resume_and_attach(self):
+        """Части дописываются по смещению, токен прикрепляется к посту."""
+        token = self.start().json()['token']
+
+        first = self.send(token, 0, SMALL_GIF[:20])
+        repeated = self.send(token, 0, SMALL_GIF[:20])
+        last = self.send(token, 20, SMALL_GIF[20:])
+
+        self.assertEqual(first.json()['offset'], 20)
+        self.assertEqual(repeated.status_code, HTTPStatus.CONFLICT)
+        self.assertEqual(repeated.json()['offset'], 20)
+        self.assertTrue(last.json()['complete'])
+        self.assertEqual(last.json()['sha256'],
+                         hashlib.sha256(SMALL_GIF).hexdigest())
+
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с загрузкой', 'upload': token})
+        post = Post.objects.get(text='Пост с загрузкой')
+
+        self.assertTrue(post.image.name.startswith('posts/small'))
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertFalse(Upload.objects.filter(token=token).exists())
+
+    def test_upload_limits(self):
+        """Размер, тип и длина части проверяются сразу."""
+        token = self.start().json()['token']
+
+        self.assertEqual(self.start('notes.txt').status_code,
+                         HTTPStatus.BAD_REQUEST)
+        self.assertEqual(
+            self.send(token, 0, b'not an image at all').status_code,
+            HTTPStatus.BAD_REQUEST)
+        self.assertEqual(self.send(token, 0, SMALL_GIF).status_code,
+                         HTTPStatus.BAD_REQUEST)
+
+    def upload(self, data=SMALL_GIF):
+        token = self.start().json()['token']
+        Upload.objects.filter(token=token).update(size=len(data))
+        for offset in range(0, len(data), settings.UPLOAD_CHUNK_SIZE):
+            self.send(token, offset,
+                      data[offset:offset + settings.UPLOAD_CHUNK_SIZE])
+        return token
+
+    def test_upload_replaces_image_on_edit(self):
+        """Загрузка заменяет картинку редактируемого поста."""
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image='posts/old.gif')
+        token = self.upload()
+
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={'text': 'Пост', 'upload': token})
+
+        post.refresh_from_db()
+        self.assertTrue(post.image.name.startswith('posts/small'))
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+
+    def test_upload_checked_by_pillow(self):
+        """Подпись GIF без картинки за ней не проходит проверку формы."""
+        token = self.upload(b'GIF89a' + bytes(20))
+
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Поддельная картинка', 'upload': token})
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse(
+            Post.objects.filter(text='Поддельная картинка').exists())
+        self.assertTrue(Upload.objects.filter(token=token).exists())
+
+    def test_stale_chunk_does_not_touch_file(self):
+        """Проигравшая гонку часть не перезаписывает уже принятые байты."""
+        token = self.start().json()['token']
+        stale = Upload.objects.get(token=token)
+        self.send(token, 0, SMALL_GIF[:20])
+
+        offset = uploads.append(stale, 0, BytesIO(b'GIF89a' + bytes(14)), 20)
+
+        self.assertIsNone(offset)
+        with open(uploads.path(stale), 'rb') as stored:
+            self.assertEqual(stored.read(), SMALL_GIF[:20])
+
+    def test_expire_uploads(self):
+        """Брошенные загрузки и их файлы удаляются по UPLOAD_TTL."""
+        old = self.start().json()['token']
+        fresh = self.start().json()['token']
+        Upload.objects.filter(token=old).update(
+            created=timezone.now() - timedelta(seconds=settings.UPLOAD_TTL
+                                               + 1))
+        old_path = os.path.join(settings.CHUNKED_UPLOAD_DIR, old)
+        os.utime(old_path, (0, 0))
+        out = StringIO()
+
+        call_command('expire_uploads', stdout=out)
+
+        self.assertEqual(list(Upload.objects.values_list('token', flat=True)),
+                         [fresh])
+        self.assertFalse(os.path.exists(old_path))
+        self.assertIn('Удалено загрузок: 1', out.getvalue())
+
+    @mock.patch('posts.uploads.MAX_HASHERS', 1)
+    def test_hashers_bounded(self):
+        """В памяти живут хэшеры только последних загрузок."""
+        for _ in range(3):
+            token = self.start().json()['token']
+            self.send(token, 0, SMALL_GIF[:20])
+
+        self.assertEqual(list(uploads._hashers), [token])
@@ -1,21 +1,31 @@
+import base64
+import json
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from posts.models import Group, Post, Follow
+from core.cache import stats
+from posts import search, thumbnails
+from posts.models import Comment, Group, Post, Follow
+from posts.tests.utils import QueryPlanMixin
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False)
 class PostViewTests(TestCase):
     """Тест view приложения posts."""
 
@@ -191,19 +201,81 @@ class PostViewTests(TestCase):
                 else:
                     self.assertTrue(response.context['post'].image)
 
+    def test_views_thumbnail_not_blocking(self):
+        """Без готовой миниатюры показывается оригинал, миниатюра в очереди."""
+        cache.clear()
+        with mock.patch('posts.thumbnails.enqueue') as enqueue:
+            response = self.guest_client.get(self.post_detail_url)
+
+        self.assertContains(response, self.post.image.url)
+        enqueue.assert_called_once_with(self.post.image.name)
+
+        thumbnails.generate(self.post.image.name)
+        response = self.guest_client.get(self.post_detail_url)
+        thumbnail = thumbnails.lookup.cached(
+            self.post.image.name, thumbnails.GEOMETRY, **thumbnails.OPTIONS)
+
+        self.assertContains(response, thumbnail.url)
+        self.assertContains(response, 'type="image/webp"')
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            self.assertContains(response, f' {width}w')
+
     def test_views_cashed(self):
         """Содержимое главной страницы кэшируется."""
         response = self.authorized_client.get(self.index_url)
-        Post.objects.all().delete()
-        response_after_delete = self.authorized_client.get(self.index_url)
+        hits = stats('fragment.hit')['fragment.hit']
+        Post.objects.update(text='Изменено в обход сигналов')
+        response_after_update = self.authorized_client.get(self.index_url)
 
-        self.assertEqual(response.content, response_after_delete.content)
+        self.assertEqual(response.content, response_after_update.content)
+        self.assertEqual(stats('fragment.hit')['fragment.hit'], hits + 1)
 
         cache.clear()
         response_after_clear = self.authorized_client.get(self.index_url)
 
         self.assertNotEqual(response.content, response_after_clear.content)
 
+    def test_views_thumbnails_one_lookup(self):
+        """Миниатюры всех карточек ищутся в хранилище sorl одним запросом."""
+        cache.clear()
+        self.guest_client.get(self.index_url)
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(self.index_url)
+
+        self.assertEqual(
+            len([query for query in queries.captured_queries
+                 if 'thumbnail_kvstore' in query['sql']]), 1)
+        self.assertContains(response, 'srcset=', count=2)
+
+    def test_views_cached_without_queries(self):
+        """Лента из кэша не запрашивает страницу постов из базы."""
+        profile_url = reverse('posts:profile',
+                              kwargs={'username': self.user.username})
+        guest_client = Client()
+        guest_client.get(self.index_url)
+        guest_client.get(profile_url)
+
+        # Гостю обе страницы целиком отдает кэш страниц.
+        with self.assertNumQueries(0):
+            guest_client.get(self.index_url)
+        with self.assertNumQueries(0):
+            guest_client.get(profile_url)
+
+    def test_views_cache_invalidated(self):
+        """Новый пост сбрасывает кэш ленты, страницы кэшируются отдельно."""
+        response = self.authorized_client.get(self.index_url)
+        response_page = self.authorized_client.get(self.index_url + '?page=2')
+
+        self.assertNotEqual(response.content, response_page.content)
+
+        Post.objects.create(author=self.user, text='Совсем новый пост')
+        response_after_create = self.authorized_client.get(self.index_url)
+
+        self.assertIn('Совсем новый пост',
+                      response_after_create.content.decode())
+
     def test_views_follow(self):
         """Тест подписки на автора."""
         username_1 = self.user_1.username
@@ -306,3 +378,326 @@ class PostViewPaginatorTests(TestCase):
                 self.assertEqual(
                     len(response_2.context['page_obj']),
                     remains_post_count)
+
+    def test_views_cursor_pages(self):
+        """Курсоры ведут на следующую и предыдущую страницы."""
+        url = reverse('posts:index')
+        first = self.authorized_client.get(url).context['page_obj']
+        second = self.authorized_client.get(
+            f'{url}?{first.next_page_query()}').context['page_obj']
+        back = self.authorized_client.get(
+            f'{url}?{second.previous_page_query()}').context['page_obj']
+
+        self.assertFalse(first.has_previous())
+        self.assertEqual(second.number, 2)
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            list(second),
+            list(Post.objects.order_by('-pub_date', '-id')
+                 [settings.POSTS_PER_PAGE:]))
+        self.assertEqual(list(back), list(first))
+        self.assertEqual(back.number, 1)
+
+    def test_views_broken_cursor(self):
+        """Испорченный курсор возвращает первую страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?cursor=garbage')
+
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.POSTS_PER_PAGE)
+
+    def test_views_cursor_wrong_types(self):
+        """Курсор с чужими типами значений тоже ведет на первую страницу."""
+        for values in (['abc', 1], [{'dt': '2020-01-01T00:00:00'}, 'x'],
+                       [[1], 1], [1],
+                       [{'dt': '2020-01-01T00:00:00'}, 10 ** 25]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({'v': values, 'n': 2}).encode()).decode()
+            with self.subTest(values=values):
+                response = self.authorized_client.get(
+                    reverse('posts:index'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['page_obj'].number, 1)
+        # Номер страницы за пределами 64 бит — тоже первая страница.
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_list', kwargs={'slug': 'test'}),
+                    reverse('posts:profile', kwargs={'username': 'auth'})):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(
+                    url, {'page': '99999999999999999999'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['page_obj'].number, 1)
+        response = self.authorized_client.get(
+            reverse('api:post_list'), {'page': '99999999999999999999'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(POSTS_PER_PAGE=2, PAGINATOR_WINDOW=2)
+    def test_views_page_window(self):
+        """Навигация показывает окно вокруг текущей страницы."""
+        cases = {
+            1: [1, 2],
+            3: [1, 2, 3, 4],
+            5: [1, None, 3, 4, 5, 6],
+            7: [1, None, 5, 6, 7],
+        }
+
+        for number, expected in cases.items():
+            with self.subTest(number=number):
+                cache.clear()
+                response = self.authorized_client.get(
+                    reverse('posts:index'), {'page': number})
+                window = response.context['page_obj'].window()
+
+                self.assertEqual(
+                    [link and link.number for link in window], expected)
+                self.assertEqual(
+                    [link.number for link in window
+                     if link and link.query is None], [number])
+                self.assertNotContains(response, 'page=7"')
+
+
+class PostSearchTests(TestCase):
+    """Тест полнотекстового поиска приложения posts."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.cats = Post.objects.create(
+            author=cls.user, text='Кошки спят, кошки едят, кошки играют')
+        cls.cat = Post.objects.create(
+            author=cls.user, text='Кошка поймала мышь')
+        cls.dog = Post.objects.create(author=cls.user, text='Собака лает')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query})
+        return response.context['page_obj']
+
+    def test_reindex_keeps_search_available(self):
+        """Переиндексация идет поверх индекса и убирает удаленные посты."""
+        Post.objects.filter(pk=self.dog.pk).delete()
+        search.index([(self.dog.pk, self.dog.text)])
+        results = []
+        index = search.index
+
+        def indexing(rows, *args):
+            results.append(list(self.search('кошка')))
+            index(rows, *args)
+
+        with mock.patch('posts.search.index', indexing):
+            call_command('reindex_search', batch_size=1, stdout=StringIO())
+
+        self.assertTrue(all(results) and len(results) == 2)
+        self.assertEqual(list(self.search('собака')), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {search.FTS_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_search_ranked_by_stem(self):
+        """Поиск находит формы слова, самые подходящие посты первыми."""
+        self.assertEqual(list(self.search('кошками')),
+                         [self.cats, self.cat])
+        self.assertEqual(list(self.search('собака кошка')), [])
+        self.assertEqual(list(self.search('')), [])
+
+    def test_search_follows_changes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        dog = Post.objects.get(pk=self.dog.pk)
+        dog.text = 'Собака гоняет кошку'
+        dog.save()
+        Post.objects.filter(pk=self.cat.pk).delete()
+
+        self.assertEqual(list(self.search('кошка')), [self.cats, self.dog])
+
+    def test_search_pages_keep_query(self):
+        """Страницы поиска листаются курсором и не теряют запрос."""
+        for number in range(settings.POSTS_PER_PAGE):
+            Post.objects.create(author=self.user, text=f'Мышь номер {number}')
+
+        first = self.search('мыши')
+        second = self.guest_client.get(
+            f"{reverse('posts:search')}?{first.next_page_query()}"
+        ).context['page_obj']
+
+        self.assertEqual(len(first) + len(second),
+                         settings.POSTS_PER_PAGE + 1)
+        self.assertFalse(set(first) & set(second))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False,
+                   QUERY_STATS_HEADERS=True)
+class PostViewQueryBudgetTests(TestCase):
+    """Страницы укладываются в QUERY_BUDGETS при любом числе постов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание')
+        for number in range(5):
+            author = User.objects.create_user(username=f'author_{number}')
+            Follow.objects.create(user=cls.user, author=author)
+            post = Post.objects.create(author=author, group=cls.group,
+                                       text=f'Пост номер {number}')
+            Comment.objects.create(post=post, author=author,
+                                   text='Комментарий')
+        cls.post = post
+        cls.author = author
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_views_query_budgets(self):
+        """Число запросов view не больше бюджета и без повторов."""
+        urls = {
+            'posts:index': reverse('posts:index'),
+            'posts:group_list': reverse('posts:group_list',
+                                        kwargs={'slug': self.group.slug}),
+            'posts:profile': reverse(
+                'posts:profile', kwargs={'username': self.author.username}),
+            'posts:post_detail': reverse('posts:post_detail',
+                                         kwargs={'post_id': self.post.id}),
+            'posts:follow_index': reverse('posts:follow_index'),
+            'posts:search': reverse('posts:search') + '?q=пост',
+            'posts:comments': reverse('posts:comments',
+                                      kwargs={'post_id': self.post.id}),
+            'api:post_list': reverse('api:post_list'),
+            'api:group_posts': reverse('api:group_posts',
+                                       kwargs={'slug': self.group.slug}),
+            'api:profile_posts': reverse(
+                'api:profile_posts',
+                kwargs={'username': self.author.username}),
+            'api:post_comments': reverse('api:post_comments',
+                                         kwargs={'post_id': self.post.id}),
+            'api:follow_feed': reverse('api:follow_feed'),
+        }
+        self.assertEqual(set(urls), set(settings.QUERY_BUDGETS))
+
+        for view_name, url in urls.items():
+            with self.subTest(view_name=view_name):
+                response = self.authorized_client.get(url)
+
+                self.assertEqual(response['X-View-Name'], view_name)
+                self.assertLessEqual(int(response['X-DB-Queries']),
+                                     settings.QUERY_BUDGETS[view_name])
+                self.assertEqual(response['X-DB-Duplicates'], '')
+
+
+class PostCommentPageTests(TestCase):
+    """Комментарии поста выводятся порциями по курсору."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        for number in range(settings.COMMENTS_PER_PAGE + 5):
+            Comment.objects.create(post=cls.post, author=cls.user,
+                                   text=f'Комментарий {number}')
+        cls.detail_url = reverse('posts:post_detail',
+                                 kwargs={'post_id': cls.post.id})
+        cls.comments_url = reverse('posts:comments',
+                                   kwargs={'post_id': cls.post.id})
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_first_page_on_post_detail(self):
+        """На странице поста первая порция и счетчик без COUNT(*)."""
+        response = self.guest_client.get(self.detail_url)
+        comments = response.context['comments']
+
+        self.assertEqual(len(comments), settings.COMMENTS_PER_PAGE)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertTrue(comments.has_next())
+        self.assertContains(
+            response,
+            f'Комментариев: {settings.COMMENTS_PER_PAGE + 5}')
+        self.assertContains(
+            response, f'{self.comments_url}?{comments.next_page_query()}')
+
+    def test_load_more_fragment(self):
+        """Фрагмент по курсору продолжает список и кончается."""
+        first = self.guest_client.get(self.detail_url).context['comments']
+
+        response = self.guest_client.get(
+            f'{self.comments_url}?{first.next_page_query()}')
+
+        self.assertTemplateUsed(response, 'includes/comment_list.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'Комментарий {number}' for number in range(
+                settings.COMMENTS_PER_PAGE,
+                settings.COMMENTS_PER_PAGE + 5)])
+        self.assertNotContains(response, 'data-comments-more')
+
+    def test_load_more_json(self):
+        """С ?format=json приходят HTML порции и ссылка на следующую."""
+        data = self.guest_client.get(self.comments_url,
+                                     {'format': 'json'}).json()
+        rest = self.guest_client.get(data['next']).json()
+
+        self.assertIn('Комментарий 0', data['html'])
+        self.assertIn('format=json', data['next'])
+        self.assertIn(f'Комментарий {settings.COMMENTS_PER_PAGE}',
+                      rest['html'])
+        self.assertIsNone(rest['next'])
+
+
+class PostViewIndexTests(QueryPlanMixin, TestCase):
+    """Горячие запросы view приложения posts идут по индексам."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Тестовый пост')
+        Comment.objects.create(post=cls.post, author=cls.user,
+                               text='Комментарий')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        """Создаем авторизованного пользователя."""
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_views_use_indexes(self):
+        """Запросы страниц используют составные индексы."""
+        cases = (
+            (reverse('posts:index'), 'posts_post', 'post_date_idx'),
+            (reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+             'posts_post', 'post_group_date_idx'),
+            (reverse('posts:profile',
+                     kwargs={'username': self.author.username}),
+             'posts_post', 'post_author_date_idx'),
+            (reverse('posts:profile',
+                     kwargs={'username': self.author.username}),
+             'posts_follow',
+             r'(unique_follow|sqlite_autoindex_posts_follow_\d+)'),
+            (reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+             'posts_comment', 'comment_post_created_idx'),
+            (reverse('posts:follow_index'),
+             'posts_timeline', 'timeline_user_date_idx'),
+        )
+
+        for url, table, index in cases:
+            with self.subTest(url=url, index=index):
+                self.assertUsesIndex(self.authorized_client, url,
+                                     table, index)
@@ -0,0 +1,52 @@
+import re
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from posts import search
+
+
+def query_plans(client, url):
+    """Выполняет запрос и возвращает EXPLAIN для каждого SELECT."""
+    with CaptureQueriesContext(connection) as context:
+        client.get(url)
+    plans = []
+    with connection.cursor() as cursor:
+        for query in context.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+            plans.append((query['sql'],
+                          ' | '.join(row[-1] for row in cursor.fetchall())))
+    return plans
+
+
+class QueryPlanMixin:
+    """Проверки того, что горячие запросы view идут по индексам."""
+
+    def assertUsesIndex(self, client, url, table, index):
+        """Хотя бы один запрос к table выполняется по индексу index.
+
+        index — регулярное выражение: SQLite называет индексы
+        UniqueConstraint автоматически (sqlite_autoindex_*). В подзапросах
+        django называет таблицы псевдонимами U0, U1...
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN есть только в SQLite.')
+        pattern = re.compile(
+            rf'\b({table}|U\d+)\b.*USING (COVERING )?INDEX {index}\b')
+        plans = [plan for sql, plan in query_plans(client, url)
+                 if f'"{table}"' in sql]
+        self.assertTrue(
+            any(pattern.search(part)
+                for plan in plans for part in plan.split(' | ')),
+            f'{url}: запросы к {table} не используют {index}:\n'
+            + '\n'.join(plans))
+
+
+class SearchIndexMixin:
+    """Для TransactionTestCase: flush не очищает виртуальную таблицу FTS."""
+
+    def tearDown(self):
+        super().tearDown()
+        search.clear()
@@ -0,0 +1,198 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.images import get_image_dimensions
+from django.db import connection
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import \
+    KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import cache, db_router
+from . import feeds
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY = '960x339'
+OPTIONS = {'crop': 'center', 'upscale': True}
+VARIANT_FORMAT = 'WEBP'
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class LookupBackend(ThumbnailBackend):
+    """Ищет готовую миниатюру в key-value хранилище sorl, не создавая её."""
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def cached(self, file_, geometry_string, **options):
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options))
+
+
+lookup = LookupBackend()
+
+
+def variants():
+    """Геометрии вариантов для srcset с пропорциями основной миниатюры."""
+    width, height = (int(side) for side in GEOMETRY.split('x'))
+    return [(variant, f'{variant}x{round(variant * height / width)}')
+            for variant in settings.IMAGE_VARIANT_WIDTHS]
+
+
+def renditions():
+    """Все файлы, которые создаются для картинки: (геометрия, опции)."""
+    options = dict(OPTIONS, format=VARIANT_FORMAT)
+    return [(GEOMETRY, OPTIONS)] + [(geometry, options)
+                                    for _, geometry in variants()]
+
+
+def is_ready(name):
+    return all(lookup.cached(name, geometry, **options) is not None
+               for geometry, options in renditions())
+
+
+def _files(name):
+    """Миниатюра и варианты srcset картинки: [(ширина варианта, файл)]."""
+    options = dict(OPTIONS, format=VARIANT_FORMAT)
+    return ([(None, lookup.thumbnail_file(name, GEOMETRY, **OPTIONS))]
+            + [(width, lookup.thumbnail_file(name, geometry, **options))
+               for width, geometry in variants()])
+
+
+def _get_many(keys):
+    """Записи key-value хранилища sorl одним get_many к его кэшу.
+
+    Ключи, которых нет в кэше, дочитываются из базы одним запросом, а
+    отсутствие записи кэшируется, как это делает сам sorl.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        values = {key: kvstore._get_raw(key) for key in keys}
+    else:
+        values = kvstore.cache.get_many(list(keys))
+        missing = set(keys) - set(values)
+        if missing:
+            stored = dict(KVStoreModel.objects.filter(key__in=missing)
+                          .values_list('key', 'value'))
+            found = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+            kvstore.cache.set_many(found,
+                                   sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(found)
+    return {key: deserialize_image_file(value)
+            for key, value in values.items()
+            if value is not None and value != EMPTY_VALUE}
+
+
+def _describe(name, found):
+    (_, thumbnail), *ready = found
+    if thumbnail is None or any(variant is None for _, variant in ready):
+        enqueue(name)
+    if thumbnail is None:
+        return None
+    return {
+        'url': thumbnail.url,
+        'width': thumbnail.width,
+        'height': thumbnail.height,
+        'srcset': ', '.join(f'{variant.url} {width}w'
+                            for width, variant in ready if variant),
+    }
+
+
+def cached_images(images):
+    """Готовые миниатюры всех картинок страницы: {имя файла: миниатюра}.
+
+    Все записи sorl читаются сразу; недостающее ставится в очередь, а
+    вместо миниатюры возвращается None, и шаблон показывает оригинал.
+    """
+    files = {image.name: _files(image.name) for image in images if image}
+    values = _get_many({add_prefix(file.key) for found in files.values()
+                        for _, file in found})
+    return {name: _describe(name, [(width, values.get(add_prefix(file.key)))
+                                   for width, file in found])
+            for name, found in files.items()}
+
+
+def cached_image(image):
+    """Готовые миниатюра и srcset одного поста, см. cached_images."""
+    if not image:
+        return None
+    return cached_images([image])[image.name]
+
+
+def image_size(image):
+    """Размеры загруженной картинки; форма уже открыла её через Pillow."""
+    if not image:
+        return None, None
+    if getattr(image, 'image', None) is not None:
+        return image.image.size
+    return get_image_dimensions(image)
+
+
+def generate(name):
+    """Создает миниатюры и сбрасывает кэш лент, где висит оригинал."""
+    for geometry, options in renditions():
+        get_thumbnail(name, geometry, **options)
+    posts = Post.objects.filter(image=name)
+    if posts.filter(image_width__isnull=True).exists():
+        with default.storage.open(name) as image:
+            width, height = get_image_dimensions(image)
+        posts.update(image_width=width, image_height=height)
+    # Карточки с оригиналом вместо миниатюры пора перерисовать.
+    posts.update(updated_at=timezone.now())
+    for post in posts.values('id', 'author_id', 'group_id'):
+        cache.bump(*feeds.for_post(post['author_id'], post['group_id'],
+                                   post['id']))
+
+
+def _work(name):
+    try:
+        # Пост только что записан, реплика могла его еще не получить.
+        with db_router.use_primary():
+            generate(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        connection.close()
+
+
+def enqueue(name):
+    """Ставит создание миниатюры в фоновый пул потоков."""
+    global _executor
+    if not settings.THUMBNAIL_ASYNC:
+        generate(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    _executor.submit(_work, name)
@@ -0,0 +1,154 @@
+from django.conf import settings
+from django.db.models import F
+
+from .models import AuthorCounters, Follow, Post, Timeline
+
+BATCH_SIZE = 500
+ORDERING = ('-pub_date', '-post_id')
+
+
+def is_popular(author_id):
+    """Автор, чьи посты раздаются читателям при чтении, а не при записи."""
+    return AuthorCounters.objects.filter(
+        user_id=author_id,
+        follower_count__gte=settings.TIMELINE_FANOUT_LIMIT).exists()
+
+
+def popular_authors(user):
+    """Популярные авторы из подписок пользователя."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__counters__follower_count__gte=(
+                settings.TIMELINE_FANOUT_LIMIT))
+        .values_list('author_id', flat=True)
+    )
+
+
+def _entries(user_ids, posts):
+    return [Timeline(user_id=user_id, post_id=post.id,
+                     pub_date=post.pub_date)
+            for user_id in user_ids for post in posts]
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_popular(post.author_id):
+        return
+    follower_ids = (Follow.objects.filter(author_id=post.author_id)
+                    .values_list('user_id', flat=True))
+    Timeline.objects.bulk_create(_entries(follower_ids, [post]),
+                                 batch_size=BATCH_SIZE,
+                                 ignore_conflicts=True)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    posts = (Post.objects.filter(author_id=author_id)
+             .order_by('-pub_date', '-id')
+             .only('id', 'pub_date')[:settings.TIMELINE_BACKFILL])
+    Timeline.objects.bulk_create(_entries([user_id], posts),
+                                 batch_size=BATCH_SIZE,
+                                 ignore_conflicts=True)
+
+
+def demote(author_id):
+    """Раскладывает последние посты автора, переставшего быть популярным.
+
+    Пока автор был популярным, его посты читались при чтении ленты и не
+    попадали в Timeline. Без раскладки они пропали бы из лент
+    подписчиков, как только автор опустился ниже порога.
+    """
+    posts = list(Post.objects.filter(author_id=author_id)
+                 .order_by('-pub_date', '-id')
+                 .only('id', 'pub_date')[:settings.TIMELINE_BACKFILL])
+    follower_ids = (Follow.objects.filter(author_id=author_id)
+                    .values_list('user_id', flat=True))
+    Timeline.objects.bulk_create(_entries(follower_ids, posts),
+                                 batch_size=BATCH_SIZE,
+                                 ignore_conflicts=True)
+
+
+def unfollowed(author_id):
+    """Отписка, после которой автор опустился ниже порога раскладки."""
+    followers = (AuthorCounters.objects.filter(user_id=author_id)
+                 .values_list('follower_count', flat=True).first())
+    if followers == settings.TIMELINE_FANOUT_LIMIT - 1:
+        demote(author_id)
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    Timeline.objects.filter(user_id=user_id,
+                            post__author_id=author_id).delete()
+
+
+class Feed:
+    """Лента подписок: записи Timeline и посты популярных авторов.
+
+    Посты популярных авторов не раскладываются по лентам, а читаются
+    отдельным запросом и сливаются с Timeline в Python: чтение ленты
+    ничего не пишет, и свежие посты не теряются, сколько бы их ни было.
+    Поддерживает то, что нужно CursorPaginator: order_by, filter по
+    ключу (pub_date, post_id) и срез. Элементы — посты из queryset posts.
+    """
+
+    def __init__(self, user, posts, popular, ordering=ORDERING):
+        self.posts = posts.annotate(post_id=F('id'))
+        self.ordering = tuple(ordering)
+        self.entries = (Timeline.objects.filter(user=user)
+                        .order_by(*self.ordering))
+        self.popular = (self.posts.filter(author_id__in=popular)
+                        .order_by(*self.ordering) if popular else None)
+
+    # Типы полей ключа сортировки для CursorPaginator.
+    model = Timeline
+
+    @property
+    def query(self):
+        return self.entries.query
+
+    def _clone(self, entries, popular, ordering):
+        feed = Feed.__new__(Feed)
+        feed.posts = self.posts
+        feed.entries = entries
+        feed.popular = popular
+        feed.ordering = tuple(ordering)
+        return feed
+
+    def order_by(self, *ordering):
+        return self._clone(
+            self.entries.order_by(*ordering),
+            (self.popular.order_by(*ordering)
+             if self.popular is not None else None),
+            ordering)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(
+            self.entries.filter(*args, **kwargs),
+            (self.popular.filter(*args, **kwargs)
+             if self.popular is not None else None),
+            self.ordering)
+
+    def __getitem__(self, index):
+        """Срез: каждый источник читает не больше stop строк по индексу.
+
+        Записи Timeline выбираются подзапросом, посты — тем же запросом.
+        """
+        stop = index.stop
+        merged = {post.id: post for post in self.posts.filter(
+            pk__in=self.entries.values('post_id')[:stop])}
+        if self.popular is not None:
+            merged.update((post.id, post) for post in self.popular[:stop])
+        rows = list(merged.values())
+        for field in reversed(self.ordering):
+            rows.sort(key=lambda post: getattr(post, field.lstrip('-')),
+                      reverse=field.startswith('-'))
+        return rows[index.start:stop]
+
+
+def feed(user, posts=None):
+    """Лента подписок пользователя: посты по убыванию даты."""
+    if posts is None:
+        posts = Post.objects.select_related('group', 'author')
+    return Feed(user, posts, popular_authors(user))
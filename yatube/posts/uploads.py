@@ -0,0 +1,181 @@
+import datetime
+import fcntl
+import hashlib
+import os
+import secrets
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from core import db_router
+from .models import Upload
+
+READ_BLOCK = 64 * 1024
+SIGNATURES = {
+    b'\xff\xd8\xff': 'image/jpeg',
+    b'\x89PNG\r\n\x1a\n': 'image/png',
+    b'GIF87a': 'image/gif',
+    b'GIF89a': 'image/gif',
+}
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# Хэш считается на лету; если следующая часть пришла в другой процесс,
+# после перезапуска или хэшер вытеснен, состояние восстанавливается
+# чтением файла. Хранятся только последние MAX_HASHERS загрузок.
+MAX_HASHERS = 100
+
+_hashers = OrderedDict()
+_lock = threading.Lock()
+
+
+def path(upload):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, upload.token)
+
+
+def sniff(head):
+    """MIME-тип картинки по сигнатуре первых байтов."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, content_type in SIGNATURES.items():
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def start(user, filename, size):
+    """Проверяет заявленные имя и размер и заводит загрузку."""
+    if os.path.splitext(filename)[1].lower() not in EXTENSIONS:
+        raise ValidationError('Можно загружать только картинки.')
+    if not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        raise ValidationError('Недопустимый размер файла.')
+    upload = Upload.objects.create(user=user, token=secrets.token_urlsafe(32),
+                                   filename=os.path.basename(filename),
+                                   size=size)
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(path(upload), 'wb').close()
+    return upload
+
+
+def _hasher(upload):
+    with _lock:
+        hasher, position = _hashers.pop(upload.token, (None, None))
+    if hasher is not None and position == upload.offset:
+        return hasher
+    hasher = hashlib.sha256()
+    with open(path(upload), 'rb') as stored:
+        remaining = upload.offset
+        while remaining:
+            block = stored.read(min(READ_BLOCK, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def _remember(token, hasher, position):
+    with _lock:
+        _hashers[token] = (hasher, position)
+        _hashers.move_to_end(token)
+        while len(_hashers) > MAX_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def append(upload, offset, stream, length):
+    """Дописывает часть с позиции offset, возвращает новую позицию.
+
+    Возвращает None, если offset не совпал с уже загруженным (клиент
+    должен спросить текущую позицию и продолжить с неё). Части одной
+    загрузки пишутся по очереди: файл заблокирован, а позиция
+    перечитывается из базы уже под блокировкой.
+    """
+    if length > settings.UPLOAD_CHUNK_SIZE or offset + length > upload.size:
+        raise ValidationError('Часть файла слишком большая.')
+    with open(path(upload), 'r+b') as stored:
+        fcntl.flock(stored, fcntl.LOCK_EX)
+        with db_router.use_primary():
+            upload.refresh_from_db(fields=['offset'])
+        if offset != upload.offset:
+            return None
+        hasher = _hasher(upload)
+        written = 0
+        stored.seek(offset)
+        stored.truncate()
+        while written < length:
+            block = stream.read(min(READ_BLOCK, length - written))
+            if not block:
+                break
+            if offset == 0 and written == 0 and sniff(block) is None:
+                raise ValidationError('Файл не похож на картинку.')
+            stored.write(block)
+            hasher.update(block)
+            written += len(block)
+        stored.flush()
+        new_offset = offset + written
+        fields = {'offset': new_offset}
+        if new_offset == upload.size:
+            fields['sha256'] = hasher.hexdigest()
+        elif written:
+            _remember(upload.token, hasher, new_offset)
+        if not Upload.objects.filter(pk=upload.pk,
+                                     offset=offset).update(**fields):
+            return None
+    for field, value in fields.items():
+        setattr(upload, field, value)
+    return new_offset
+
+
+def claim(user, token):
+    """Завершенная загрузка пользователя как файл для ImageField."""
+    upload = Upload.objects.filter(user=user, token=token).first()
+    if upload is None or not upload.complete:
+        raise ValidationError('Загрузка не найдена или не завершена.')
+    return upload, File(open(path(upload), 'rb'), name=upload.filename)
+
+
+def _remove(name):
+    try:
+        os.remove(name)
+    except FileNotFoundError:
+        pass
+
+
+def discard(upload):
+    """Удаляет загрузку, а файл — только после коммита транзакции."""
+    with _lock:
+        _hashers.pop(upload.token, None)
+    name = path(upload)
+    upload.delete()
+    transaction.on_commit(lambda: _remove(name))
+
+
+def expire(now=None):
+    """Удаляет брошенные загрузки старше UPLOAD_TTL и их файлы.
+
+    Файлы без строки в базе (упавшая транзакция, ручная чистка) тоже
+    удаляются, если не менялись дольше UPLOAD_TTL. Возвращает число
+    удаленных загрузок и файлов.
+    """
+    now = now or timezone.now()
+    deadline = now - datetime.timedelta(seconds=settings.UPLOAD_TTL)
+    expired = Upload.objects.filter(created__lt=deadline)
+    tokens = list(expired.values_list('token', flat=True))
+    expired.delete()
+    with _lock:
+        for token in tokens:
+            _hashers.pop(token, None)
+    if not os.path.isdir(settings.CHUNKED_UPLOAD_DIR):
+        return len(tokens), 0
+    alive = set(Upload.objects.values_list('token', flat=True))
+    removed = 0
+    for entry in os.scandir(settings.CHUNKED_UPLOAD_DIR):
+        if (entry.is_file() and entry.name not in alive
+                and entry.stat().st_mtime < deadline.timestamp()):
+            _remove(entry.path)
+            removed += 1
+    return len(tokens), removed
@@ -6,6 +6,7 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('search/', views.post_search, name='search'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
@@ -16,5 +17,10 @@ urlpatterns = [
          name='profile_follow'),
     path('profile/<str:username>/unfollow/', views.profile_unfollow,
          name='profile_unfollow'),
-    path('posts/<int:post_id>/comment/', views.add_comment, name='add_comment')
+    path('posts/<int:post_id>/comment/', views.add_comment,
+         name='add_comment'),
+    path('posts/<int:post_id>/comments/', views.post_comments,
+         name='comments'),
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<str:token>/', views.upload_chunk, name='upload_chunk'),
 ]
@@ -1,10 +1,270 @@
+import base64
+import binascii
+import datetime
+import json
+from collections import namedtuple
+from collections.abc import Sequence
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
+
+DEFAULT_ORDERING = ('-pub_date', '-id')
+# Границы целых SQLite: числа за ними база не принимает.
+MAX_INT = 2 ** 63 - 1
+
+PageLink = namedtuple('PageLink', 'number query')
+
+
+def encode_cursor(values, number, backwards=False):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+    payload = {
+        'v': [{'dt': value.isoformat()}
+              if isinstance(value, datetime.datetime) else value
+              for value in values],
+        'n': number,
+    }
+    if backwards:
+        payload['b'] = 1
+    data = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора, ValueError для испорченных токенов."""
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(data.decode())
+        values = [parse_datetime(value['dt'])
+                  if isinstance(value, dict) else value
+                  for value in payload['v']]
+        number = int(payload['n'])
+    except (binascii.Error, UnicodeDecodeError, ValueError,
+            OverflowError, TypeError, KeyError):
+        raise ValueError('Некорректный курсор.')
+    if None in values:
+        raise ValueError('Некорректный курсор.')
+    return values, max(number, 1), bool(payload.get('b'))
+
+
+class CursorPage(Sequence):
+    """Страница курсорной пагинации, совместимая с django Page."""
+
+    def __init__(self, object_list, number, next_cursor=None,
+                 previous_cursor=None, params=''):
+        self.object_list = object_list
+        self.number = number
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.params = params
+
+    def __repr__(self):
+        return f'<CursorPage {self.number}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def _query(self, query):
+        """Ссылка на страницу с сохранением остальных GET-параметров."""
+        return f'{self.params}&{query}' if self.params else query
+
+    def first_page_query(self):
+        return self._query('page=1')
+
+    def next_page_query(self):
+        return self._query(f'cursor={self.next_cursor}')
+
+    def previous_page_query(self):
+        if self.previous_cursor is None:
+            return self._query(f'page={self.previous_page_number()}')
+        return self._query(f'cursor={self.previous_cursor}')
 
+    def window(self):
+        """Ссылки на соседние страницы для навигации, None — многоточие.
 
-def paginate_pls(request, post_list):
+        Все предыдущие страницы существуют, а о следующих известно только
+        has_next. Поэтому навигации не нужно общее число записей, и ее
+        размер не зависит от длины ленты.
+        """
+        size = settings.PAGINATOR_WINDOW
+        start = max(self.number - size, 1)
+        links = []
+        if start > 1:
+            links.append(PageLink(1, self.first_page_query()))
+        if start > 2:
+            links.append(None)
+        links.extend(PageLink(number, self._query(f'page={number}'))
+                     for number in range(start, self.number - 1))
+        if self.has_previous():
+            links.append(PageLink(self.previous_page_number(),
+                                  self.previous_page_query()))
+        links.append(PageLink(self.number, None))
+        if self.has_next():
+            links.append(PageLink(self.next_page_number(),
+                                  self.next_page_query()))
+        return links
+
+
+class CursorPaginator:
+    """Keyset-пагинация по полям ordering без COUNT(*) и OFFSET.
+
+    Последнее поле ordering должно быть уникальным (обычно id), иначе
+    записи с одинаковым ключом могут потеряться на границе страниц.
+    """
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+
+    def _field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(name)
+
+    def _coerce(self, values):
+        """Значения курсора в типы полей сортировки.
+
+        Курсор приходит от клиента: строка на месте id или число за
+        пределами 64 бит иначе упали бы только при запросе к базе.
+        """
+        if len(values) != len(self.ordering):
+            raise ValueError('Некорректный курсор.')
+        values = [self._field(name).to_python(value)
+                  for name, value in zip(self.fields, values)]
+        if any(isinstance(value, int) and not -MAX_INT - 1 <= value <= MAX_INT
+               for value in values):
+            raise ValueError('Некорректный курсор.')
+        return values
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def _ordered(self, backwards=False):
+        if not backwards:
+            return self.queryset.order_by(*self.ordering)
+        return self.queryset.order_by(*[
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        ])
+
+    def _seek(self, values, backwards=False):
+        """Условие «строго после values» в выбранном направлении."""
+        condition = Q()
+        for position, field in enumerate(self.ordering):
+            descending = field.startswith('-') != backwards
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{self.fields[position]}__{lookup}':
+                        values[position]})
+            for name, value in zip(self.fields[:position],
+                                   values[:position]):
+                step &= Q(**{name: value})
+            condition |= step
+        return condition
+
+    def _build(self, rows, number, has_more, has_before):
+        object_list = rows[:self.per_page]
+        next_cursor = previous_cursor = None
+        if has_more and object_list:
+            next_cursor = encode_cursor(
+                self._key(object_list[-1]), number + 1)
+        if has_before and object_list:
+            previous_cursor = encode_cursor(
+                self._key(object_list[0]), number - 1, backwards=True)
+        return CursorPage(object_list, number, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        """Страница после (или до) курсора; битый курсор — первая."""
+        try:
+            values, number, backwards = decode_cursor(cursor)
+            values = self._coerce(values)
+        except (TypeError, ValueError, OverflowError, ValidationError):
+            return self.page_number(1)
+        rows = list(self._ordered(backwards)
+                    .filter(self._seek(values, backwards))
+                    [:self.per_page + 1])
+        if not backwards:
+            return self._build(rows, number, len(rows) > self.per_page,
+                               number > 1)
+        if len(rows) <= self.per_page:
+            return self.page_number(1)
+        rows = rows[:self.per_page][::-1]
+        return self._build(rows, max(number, 2), True, True)
+
+    def page_number(self, number):
+        """Совместимость со старыми ссылками вида ?page=N.
+
+        Номер, смещение которого не влезает в целое SQLite, — первая
+        страница, как и нечисловой.
+        """
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        if number * self.per_page >= MAX_INT:
+            number = 1
+        offset = (number - 1) * self.per_page
+        rows = list(self._ordered()[offset:offset + self.per_page + 1])
+        return self._build(rows, number, len(rows) > self.per_page,
+                           number > 1)
+
+
+def batches(queryset, size):
+    """Первичные ключи queryset пачками по size, без OFFSET."""
+    last = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last).order_by('pk')
+                   .values_list('pk', flat=True)[:size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def paginate_pls(request, post_list, ordering=DEFAULT_ORDERING,
+                 per_page=None):
     """Функция для создания пагинации Post на странице."""
-    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    paginator = CursorPaginator(post_list,
+                                per_page or settings.POSTS_PER_PAGE, ordering)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        page = paginator.page(cursor)
+    else:
+        page = paginator.page_number(request.GET.get('page'))
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('page', None)
+    page.params = params.urlencode()
+    return page
+
+
+def lazy_page(request, post_list, ordering=DEFAULT_ORDERING):
+    """Страница, которая выбирается из базы при первом обращении.
+
+    Если фрагмент ленты уже лежит в кэше, шаблон к странице не обращается
+    и запроса к базе нет вовсе.
+    """
+    return SimpleLazyObject(
+        lambda: paginate_pls(request, post_list, ordering))
@@ -1,72 +1,142 @@
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.views.decorators.http import (condition, require_GET,
+                                          require_http_methods, require_POST)
 
+from core.middleware import cache_for_anonymous
+from core.sqlite import retry_on_lock
+
+from . import counters, etags, feeds, search, timeline, uploads
 from .forms import PostForm, CommentForm
-from .models import Group, Post, Comment, Follow
-from .utils import paginate_pls
+from .models import Group, Post, Comment, Follow, Upload
+from .utils import lazy_page, paginate_pls
 
 User = get_user_model()
 
+COMMENT_ORDERING = ('created', 'id')
+
 
 def index(request):
     """Главная страница записей."""
+    cache_for_anonymous(request, feeds.INDEX)
     post_list = Post.objects.select_related('group', 'author').all()
     context = {
-        'page_obj': paginate_pls(request, post_list),
+        'page_obj': lazy_page(request, post_list),
+        'feeds': feeds.INDEX,
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=etags.group_posts)
 def group_posts(request, slug):
     """Возвращает посты, отфильтрованные по группам."""
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.group_posts.all()
+    cache_for_anonymous(request, feeds.group(group.pk))
+    post_list = group.group_posts.select_related('group', 'author')
     context = {
-        'page_obj': paginate_pls(request, post_list),
+        'page_obj': lazy_page(request, post_list),
         'group': group,
+        'feeds': feeds.group(group.pk),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=etags.profile)
 def profile(request, username):
     """Страница профайла пользователя."""
-    post_author = get_object_or_404(User, username=username)
-    post_list = (Post.objects.select_related('group', 'author')
-                 .filter(author__username=username))
-    post_count = post_list.count()
-    following = False
+    authors = User.objects.select_related('counters')
     if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=post_author).exists()
+        authors = authors.annotate(is_followed=Exists(Follow.objects.filter(
+            user=request.user, author=OuterRef('pk'))))
+    post_author = get_object_or_404(authors, username=username)
+    cache_for_anonymous(request, feeds.profile(post_author.pk),
+                        feeds.follows(post_author.pk))
+    post_list = (Post.objects.select_related('group', 'author')
+                 .filter(author=post_author))
     context = {
-        'page_obj': paginate_pls(request, post_list),
-        'post_count': post_count,
+        'page_obj': lazy_page(request, post_list),
+        'counters': counters.for_user(post_author),
         'post_author': post_author,
-        'following': following,
+        'following': getattr(post_author, 'is_followed', False),
+        'feeds': feeds.profile(post_author.pk),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def post_search(request):
+    """Поиск по тексту постов, сначала самые подходящие."""
+    query = request.GET.get('q', '').strip()
+    post_list, ordering = search.ranked(
+        Post.objects.select_related('group', 'author'), query)
+    context = {
+        'page_obj': paginate_pls(request, post_list, ordering),
+        'query': query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@condition(etag_func=etags.post_detail)
 def post_detail(request, post_id):
     """Страница для просмотра отдельного поста."""
-    post = Post.objects.select_related('group', 'author').get(pk=post_id)
-    post_count = Post.objects.filter(author__username=post.author).count()
-    comments = Comment.objects.filter(post_id=post_id).select_related('author')
+    post = get_object_or_404(
+        Post.objects.select_related('group', 'author__counters'), pk=post_id)
+    cache_for_anonymous(request, *feeds.post_page(post.author_id,
+                                                  post.group_id, post.pk))
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
-        'post_count': post_count,
-        'comments': comments,
+        'counters': counters.for_user(post.author),
+        'comments': comment_page(request, post_id),
         'form': form
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comment_page(request, post_id):
+    """Порция комментариев от старых к новым по курсору (created, id)."""
+    return paginate_pls(
+        request,
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        COMMENT_ORDERING, settings.COMMENTS_PER_PAGE)
+
+
+@require_GET
+@condition(etag_func=etags.post_detail)
+def post_comments(request, post_id):
+    """Следующая порция комментариев для кнопки «Показать еще».
+
+    Отдает HTML-фрагмент, а с ?format=json — фрагмент и ссылку на
+    следующую порцию в JSON.
+    """
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    context = {'post': post, 'comments': comment_page(request, post_id)}
+    if request.GET.get('format') != 'json':
+        return render(request, 'includes/comment_list.html', context)
+    page = context['comments']
+    return JsonResponse({
+        'html': render_to_string('includes/comment_list.html', context,
+                                 request),
+        'next': (reverse('posts:comments', args=[post_id])
+                 + f'?{page.next_page_query()}'
+                 if page.has_next() else None),
+    })
+
+
 @login_required
+@retry_on_lock
+@transaction.atomic
 def post_create(request):
     """Страница для создания поста."""
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(request.POST or None, files=request.FILES or None,
+                    user=request.user)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
@@ -76,21 +146,25 @@ def post_create(request):
 
 
 @login_required
+@retry_on_lock
+@transaction.atomic
 def post_edit(request, post_id):
     """Страница для редактирования поста."""
     post = get_object_or_404(Post, id=post_id)
     if request.user != post.author:
         return redirect('posts:post_detail', post_id)
     form = PostForm(request.POST or None, files=request.FILES or None,
-                    instance=post)
+                    instance=post, user=request.user)
     if form.is_valid():
-        post.save()
+        form.save()
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/create_post.html',
                   {'form': form, 'post': post, 'is_edit': True})
 
 
 @login_required
+@retry_on_lock
+@transaction.atomic
 def add_comment(request, post_id):
     """Комментирование поста."""
     post = get_object_or_404(Post, id=post_id)
@@ -106,15 +180,17 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     """Получение постов авторов в подписках из базы данных."""
-    post_list = (Post.objects.select_related('group', 'author').
-                 filter(author__following__user=request.user))
+    page_obj = paginate_pls(request, timeline.feed(request.user),
+                            ordering=timeline.ORDERING)
     context = {
-        'page_obj': paginate_pls(request, post_list),
+        'page_obj': page_obj,
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@retry_on_lock
+@transaction.atomic
 def profile_follow(request, username):
     """Подписаться на автора."""
     author = get_object_or_404(User, username=username)
@@ -124,8 +200,59 @@ def profile_follow(request, username):
 
 
 @login_required
+@retry_on_lock
+@transaction.atomic
 def profile_unfollow(request, username):
     """Отписаться от автора."""
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('posts:profile', username=username)
+
+
+def upload_state(upload):
+    return {
+        'token': upload.token,
+        'offset': upload.offset,
+        'size': upload.size,
+        'complete': upload.complete,
+        'sha256': upload.sha256,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+    }
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    """Начало загрузки картинки по частям."""
+    try:
+        upload = uploads.start(request.user,
+                               request.POST.get('filename', ''),
+                               int(request.POST.get('size', '')))
+    except ValueError:
+        return JsonResponse({'error': 'Не указан размер файла.'}, status=400)
+    except ValidationError as error:
+        return JsonResponse({'error': error.messages[0]}, status=400)
+    return JsonResponse(upload_state(upload), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PATCH'])
+def upload_chunk(request, token):
+    """Состояние загрузки (GET) или следующая часть файла (PATCH)."""
+    upload = get_object_or_404(Upload, token=token, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse(upload_state(upload))
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Не указано смещение части.'},
+                            status=400)
+    try:
+        new_offset = uploads.append(upload, offset, request, length)
+    except ValidationError as error:
+        return JsonResponse({'error': error.messages[0]}, status=400)
+    if new_offset is None:
+        upload.refresh_from_db()
+        return JsonResponse(upload_state(upload), status=409)
+    return JsonResponse(upload_state(upload))
@@ -0,0 +1,58 @@
+// Загружает картинку поста частями до отправки формы и подставляет
+// токен загрузки в скрытое поле upload. Без JS форма работает как раньше.
+(function () {
+  var form = document.querySelector('form[data-upload-url]');
+  if (!form || !window.fetch) {
+    return;
+  }
+  var input = form.querySelector('input[type="file"][name="image"]');
+  var token = form.querySelector('input[name="upload"]');
+  var csrf = form.querySelector('input[name="csrfmiddlewaretoken"]').value;
+  var submit = form.querySelector('button[type="submit"]');
+
+  function request(url, options) {
+    options.headers = Object.assign({'X-CSRFToken': csrf}, options.headers);
+    options.credentials = 'same-origin';
+    return fetch(url, options).then(function (response) {
+      return response.json().then(function (state) {
+        if (!response.ok && response.status !== 409) {
+          throw new Error(state.error);
+        }
+        return state;
+      });
+    });
+  }
+
+  function send(file, state) {
+    if (state.complete) {
+      return state;
+    }
+    var chunk = file.slice(state.offset, state.offset + state.chunk_size);
+    return request(form.dataset.uploadUrl + state.token + '/', {
+      method: 'PATCH',
+      headers: {'Upload-Offset': String(state.offset)},
+      body: chunk
+    }).then(function (next) {
+      return send(file, next);
+    });
+  }
+
+  input.addEventListener('change', function () {
+    var file = input.files[0];
+    if (!file) {
+      return;
+    }
+    var body = new FormData();
+    body.append('filename', file.name);
+    body.append('size', file.size);
+    submit.disabled = true;
+    request(form.dataset.uploadUrl, {method: 'POST', body: body})
+      .then(function (state) { return send(file, state); })
+      .then(function (state) {
+        token.value = state.token;
+        input.value = '';
+      })
+      .catch(function (error) { window.alert(error.message); })
+      .then(function () { submit.disabled = false; });
+  });
+})();
@@ -0,0 +1,27 @@
+// Подгружает следующую порцию комментариев вместо перехода по ссылке
+// «Показать еще». Без JS ссылка открывает страницу поста с курсором.
+(function () {
+  if (!window.fetch) {
+    return;
+  }
+  document.addEventListener('click', function (event) {
+    var link = event.target.closest('[data-comments-more] a[data-url]');
+    if (!link) {
+      return;
+    }
+    event.preventDefault();
+    fetch(link.dataset.url, {credentials: 'same-origin'})
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.statusText);
+        }
+        return response.text();
+      })
+      .then(function (html) {
+        link.parentNode.outerHTML = html;
+      })
+      .catch(function () {
+        window.location = link.href;
+      });
+  });
+})();
@@ -30,6 +30,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,6 +71,62 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения, пути через os.pathsep:
+# REPLICA_DATABASES=/srv/replica1.sqlite3:/srv/replica2.sqlite3
+DATABASE_REPLICAS = []
+
+for number, name in enumerate(
+        filter(None, os.environ.get('REPLICA_DATABASES', '').split(
+            os.pathsep)), 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# Прагмы для каждого соединения с файловой SQLite (core.sqlite.configure).
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'journal_size_limit': 64 * 1024 * 1024,
+}
+
+SQLITE_LOCK_RETRIES = 3
+
+SQLITE_LOCK_BACKOFF = 0.05
+
+# Заголовки X-DB-* со статистикой запросов (core.middleware).
+QUERY_STATS_HEADERS = DEBUG
+
+# Сколько запросов к базе может сделать view с холодным кэшем; тесты
+# posts/tests/test_views.py проверяют, что бюджеты соблюдаются.
+QUERY_BUDGETS = {
+    'posts:index': 3,
+    'posts:group_list': 5,
+    'posts:profile': 5,
+    'posts:post_detail': 5,
+    'posts:follow_index': 4,
+    'posts:search': 3,
+    'posts:comments': 5,
+    'api:post_list': 1,
+    'api:group_posts': 2,
+    'api:profile_posts': 2,
+    'api:post_comments': 2,
+    'api:follow_feed': 4,
+}
+
+REPLICA_STICKY_SECONDS = 10
+
+REPLICA_RETRY_SECONDS = 30
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -105,6 +164,46 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 POSTS_PER_PAGE = 10
 
+COMMENTS_PER_PAGE = 20
+
+# Страницы для анонимов; таймаут ограничивает и устаревший год в подвале.
+PAGE_CACHE_TIMEOUT = 10 * 60
+
+# Прокси перед приложением держит страницы для гостей до PURGE-запроса
+# по суррогатным ключам, но не дольше PROXY_MAX_AGE.
+PROXY_MAX_AGE = 60 * 60 * 24
+
+# Адреса прокси через пробел, например http://varnish/ (пусто — не сбрасывать).
+PURGE_URLS = os.environ.get('PURGE_URLS', '').split()
+
+# PURGE для Fastly-подобных прокси, BAN для Varnish с правилом по заголовку.
+PURGE_METHOD = os.environ.get('PURGE_METHOD', 'PURGE')
+
+PURGE_BATCH_SIZE = 100
+
+PURGE_TIMEOUT = 2
+
+# Сколько секунд один воркер пересобирает значение кэша, пока остальные
+# отдают старую копию. Бета больше единицы — досрочный пересчет раньше.
+CACHE_LOCK_TIMEOUT = 10
+
+CACHE_EARLY_BETA = 1.0
+
+# Раз во сколько секунд процесс переносит счетчики cache_stats в кэш.
+CACHE_STATS_INTERVAL = 10
+
+# Карточки постов живут в кэше, пока не изменится ключ post_card.
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Сколько предыдущих страниц показывать в навигации по ленте.
+PAGINATOR_WINDOW = 2
+
+# Сколько клиенты и прокси могут держать публичные ответы API, секунд.
+API_MAX_AGE = 60
+
+# Страницы лент API живут в кэше до смены версии ленты.
+API_CACHE_TIMEOUT = 60 * 60 * 24
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -115,8 +214,43 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'yatube',
+            'OPTIONS': {'COMPRESS_MIN_LENGTH': 1024},
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.SQLiteCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+            'KEY_PREFIX': 'yatube',
+            'OPTIONS': {'COMPRESS_MIN_LENGTH': 1024,
+                        'MAX_ENTRIES': 100000},
+        }
+    }
+
+TIMELINE_FANOUT_LIMIT = 1000
+
+TIMELINE_BACKFILL = 200
+
+THUMBNAIL_ASYNC = True
+
+THUMBNAIL_WORKERS = 2
+
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
+
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+
+# Незавершенные загрузки старше суток удаляет команда expire_uploads.
+UPLOAD_TTL = 60 * 60 * 24
@@ -0,0 +1,10 @@
+"""Настройки тестов: manage.py test --settings=yatube.settings_test."""
+from .settings import *  # noqa: F401,F403
+
+# Тесты чистят кэш в setUp: рабочий Redis или cache.sqlite3 им не отдаем.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'KEY_PREFIX': 'yatube-test',
+    }
+}